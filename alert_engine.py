@@ -0,0 +1,70 @@
+import math
+import time
+import numpy as np
+
+# Default alert rule: price change (in percent) that triggers an alert, in either direction.
+# Users can override threshold, direction ("up", "down", "both") and cooldown per token.
+ALERT_THRESHOLD = 5
+ALERT_DIRECTION = "both"
+
+# Baseline policy: the baseline is the price when the token was added, and it moves to the
+# new price every time an alert is sent. Favorites without a baseline (e.g. added before
+# baselines were stored) are seeded with the first price seen by the scanner.
+
+
+def lookup_price(source_prices, source, token):
+    """Returns the price of 'token' from the per-source price tables, or NaN if unavailable."""
+    price = source_prices.get(source, {}).get(token.upper())
+    return float(price) if isinstance(price, (int, float)) else math.nan
+
+
+def evaluate_alerts(rows, source_prices, threshold=ALERT_THRESHOLD, now=None):
+    """
+    Evaluates all watched tokens in one vectorized pass.
+
+    Args:
+        rows: (user_id, source, token, last_price, threshold, direction, cooldown, last_alert_at)
+              tuples as returned by Database.get_alert_rows; the rule columns are None
+              for watches without a custom alert rule.
+        source_prices: {source: {TOKEN: price}} tables for the current cycle.
+        threshold: Default minimum change in percent that triggers an alert.
+        now: Current time used for the cooldowns (defaults to time.time()).
+
+    Returns:
+        list: (user_id, source, token, old_price, new_price) for every triggered alert.
+    """
+    if not rows:
+        return []
+
+    now = time.time() if now is None else now
+    count = len(rows)
+    old = np.fromiter((row[3] if row[3] is not None else math.nan for row in rows), dtype=float, count=count)
+    new = np.fromiter((lookup_price(source_prices, row[1], row[2]) for row in rows), dtype=float, count=count)
+    limits = np.fromiter((row[4] if row[4] is not None else threshold for row in rows), dtype=float, count=count)
+    rises = np.fromiter((row[5] != "down" for row in rows), dtype=bool, count=count)
+    drops = np.fromiter((row[5] != "up" for row in rows), dtype=bool, count=count)
+    cooldowns = np.fromiter((row[6] or 0 for row in rows), dtype=float, count=count)
+    last_alerts = np.fromiter((row[7] if row[7] is not None else math.nan for row in rows), dtype=float, count=count)
+
+    # Rows without a baseline or a current price are NaN and never compare as triggered
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (new - old) / old * 100
+    ready = ~(now - last_alerts < cooldowns)  # Never alerted (NaN) counts as ready
+    crossed = (rises & (change > limits)) | (drops & (-change > limits))
+    triggered = np.flatnonzero((old > 0) & ready & crossed)
+
+    return [(rows[i][0], rows[i][1], rows[i][2], float(old[i]), float(new[i])) for i in triggered]
+
+
+def missing_baselines(rows, source_prices):
+    """
+    Returns (user_id, source, token, price) for the rows that have no baseline yet
+    but a current price, ready for Database.update_last_prices.
+    """
+    seeds = []
+    for user_id, source, token, last_price, *_ in rows:
+        if last_price is None:
+            price = lookup_price(source_prices, source, token)
+            if not math.isnan(price):
+                seeds.append((user_id, source, token, price))
+    return seeds
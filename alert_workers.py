@@ -0,0 +1,241 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Listener, Client
+from databse import Database
+from timeseries import TimeSeriesStore
+from alert_engine import evaluate_alerts, missing_baselines
+from tokens_list import load_snapshot
+from coingecko_index import load_index as load_coingecko_index
+from price_engine import get_cached_prices, get_ticker_snapshot, close_session, BULK_TICKER_URLS
+
+# Number of alert worker processes; 0 scans in the bot process itself
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", 0))
+
+# Seconds between two scan cycles
+SCAN_INTERVAL = 300
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto 'shards' workers. Every shard owns 'replicas' points on
+    the ring, so changing the worker count moves only about 1/N of the keys. Hashes are md5
+    based and therefore identical in every process (unlike hash()).
+    """
+
+    def __init__(self, shards, replicas=100):
+        points = sorted(
+            (self._hash(f"{shard}-{replica}"), shard)
+            for shard in range(shards) for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard(self, key):
+        """Returns the shard owning 'key'."""
+        position = bisect.bisect(self.hashes, self._hash(key)) % len(self.hashes)
+        return self.shards[position]
+
+
+def symbol_key(source, token):
+    """Partition key of a watched symbol: all watchers of one (source, symbol) live on the same worker."""
+    return f"{source}:{token.upper()}"
+
+
+async def get_source_prices(source, tokens, trading_pairs):
+    """
+    Returns the {TOKEN: price} table of one source for an alert scan cycle.
+    Sources with a bulk ticker endpoint are answered from one full ticker table;
+    the others are looked up in multi-symbol batches.
+    """
+    if source in BULK_TICKER_URLS:
+        tickers = await get_ticker_snapshot(source)
+        return tickers if isinstance(tickers, dict) else {}  # The bulk request failed for this cycle
+
+    # Only known pairs, an unknown symbol would fail the whole batch
+    known = trading_pairs.get(source, set())
+    return await get_cached_prices(source, [token for token in tokens if token.upper() in known])
+
+
+async def scan_rows(rows, trading_pairs, now, history=None):
+    """
+    One alert scan over 'rows' (Database.get_alert_rows): fetches one price table per source
+    and evaluates every row in a single vectorized pass. With a TimeSeriesStore 'history',
+    one sample per watched (source, symbol) is recorded as well.
+
+    Returns:
+        tuple: (alerts, baselines) - the triggered alerts and the baselines of favorites that
+               had none yet.
+    """
+    tokens_by_source = {}
+    for _, source, token, *_ in rows:
+        tokens_by_source.setdefault(source, set()).add(token)
+
+    source_prices = {
+        source: await get_source_prices(source, tokens, trading_pairs)
+        for source, tokens in tokens_by_source.items()
+    }
+
+    if history is not None:
+        samples = {
+            source: {token: source_prices[source].get(token.upper()) for token in tokens}
+            for source, tokens in tokens_by_source.items()
+        }
+        await asyncio.to_thread(history.record, samples, now)
+
+    # Off the event loop: a million rows take over a second
+    alerts = await asyncio.to_thread(evaluate_alerts, rows, source_prices, now=now)
+    baselines = await asyncio.to_thread(missing_baselines, rows, source_prices)  # Seed favorites that have no baseline yet
+    return alerts, baselines
+
+
+class AlertWorker:
+    """
+    Scans one shard of the watched symbols in its own process.
+
+    The worker reads its rows from the shared SQLite store, writes new baselines itself and
+    hands the triggered alerts and new baselines back to the bot process through 'send',
+    where the alerts are delivered by the notifier. Delivered alerts move their baselines
+    from there.
+    """
+
+    def __init__(self, shard, shards, send, db_path="favorites.db", interval=SCAN_INTERVAL):
+        self.shard = shard
+        self.ring = HashRing(shards)
+        self.send = send
+        self.db = Database(db_path)
+        self.history = TimeSeriesStore(db_path)
+        self.interval = interval
+
+    def owned_symbols(self):
+        """(source, token) pairs of this worker's shard."""
+        return [
+            (source, token) for source, token, _ in self.db.get_watched_symbols()
+            if self.ring.shard(symbol_key(source, token)) == self.shard
+        ]
+
+    async def scan(self):
+        """Runs one scan cycle over the shard; returns the number of rows evaluated."""
+        symbols = await asyncio.to_thread(self.owned_symbols)
+        rows = await asyncio.to_thread(self.db.get_alert_rows, symbols)
+        trading_pairs = await asyncio.to_thread(load_snapshot)  # Kept fresh by the bot process
+
+        now = time.time()
+        alerts, baselines = await scan_rows(rows, trading_pairs, now, self.history)
+        if baselines:
+            await asyncio.to_thread(self.db.update_last_prices, baselines)
+            self.send(("baselines", self.shard, baselines, now))  # Mirrored in the bot's watcher index
+        if alerts:
+            self.send(("alerts", self.shard, alerts, now))
+        return len(rows)
+
+    async def run(self):
+        """Scan loop of the worker process."""
+        load_coingecko_index()
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    count = await self.scan()
+                    self.send(("stats", self.shard, {"rows": count, "duration": round(time.monotonic() - started, 2)}, None))
+                except (ConnectionError, EOFError):
+                    logging.error(f"❌ Alert worker {self.shard}: lost the connection to the bot process, stopping")
+                    return
+                except Exception as e:
+                    logging.error(f"❌ Alert worker {self.shard}: scan failed: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            await close_session()
+
+
+def run_worker(shard, shards, address, authkey, db_path="favorites.db", interval=SCAN_INTERVAL):
+    """Runs one alert worker, reporting to the bot process listening on 'address'."""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    connection = Client(address, authkey=authkey)
+    try:
+        asyncio.run(AlertWorker(shard, shards, connection.send, db_path, interval).run())
+    finally:
+        connection.close()
+
+
+def _forward_results(listener, count, results):
+    """Accepts the connections of 'count' workers and forwards their messages to 'results' (threads)."""
+    def forward(connection):
+        try:
+            while True:
+                results.put(connection.recv())
+        except (EOFError, OSError):
+            pass  # Worker stopped
+
+    with listener:  # Closed once every worker is connected
+        for _ in range(count):
+            connection = listener.accept()
+            threading.Thread(target=forward, args=(connection,), name="alert-worker-results", daemon=True).start()
+
+
+def start_workers(count, db_path="favorites.db", interval=SCAN_INTERVAL):
+    """
+    Starts 'count' alert worker processes.
+
+    Each worker is a fresh interpreter running this module as a script, so nothing of the
+    bot process (bot.py's module-level Bot, database, notifier...) is imported in it.
+    Workers connect back to a local listener authenticated with a random key.
+
+    Returns:
+        tuple: (processes, results queue)
+    """
+    authkey = secrets.token_bytes(32)
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    results = queue.Queue()
+    threading.Thread(target=_forward_results, args=(listener, count, results), name="alert-worker-accept", daemon=True).start()
+
+    host, port = listener.address
+    env = {**os.environ, "ALERT_WORKER_AUTHKEY": authkey.hex()}  # Not on the command line, where ps would show it
+    processes = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(shard), str(count), host, str(port), db_path, str(interval)],
+            env=env,
+        )
+        for shard in range(count)
+    ]
+    logging.info(f"✅ Started {count} alert worker processes")
+    return processes, results
+
+
+def stop_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def next_result(results, timeout=1):
+    """Blocking read of one worker message (meant for a thread); None if nothing arrived in time."""
+    try:
+        return results.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+if __name__ == "__main__":
+    # Worker process started by start_workers: shard, shards, host, port, db_path, interval
+    shard, shards, host, port, db_path, interval = sys.argv[1:7]
+    run_worker(
+        int(shard), int(shards), (host, int(port)), bytes.fromhex(os.environ["ALERT_WORKER_AUTHKEY"]),
+        db_path, float(interval),
+    )
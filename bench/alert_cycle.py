@@ -0,0 +1,95 @@
+"""
+One alert scan cycle over synthetic favorites (batched query + vectorized evaluation).
+
+Fills a temporary favorites.db with --users users watching --per-user tokens each (every
+tenth watch has a custom alert rule), then times the parts of a cycle: loading all rows
+with get_alert_rows, evaluating them with alert_engine.evaluate_alerts and collecting the
+missing baselines. For comparison it times the old per-user loop: active source and
+favorites per user, one get_last_price query per favorite and one committed
+update_last_price per alert. Prices move within +-2% except for --movers of the symbols,
+which move 10%.
+
+    python -m bench.alert_cycle [--users 10000] [--per-user 10] [--symbols 2000] [--movers 0.02]
+"""
+import argparse
+import random
+import time
+from bench.common import isolate
+
+isolate()
+
+from alert_engine import ALERT_THRESHOLD, evaluate_alerts, lookup_price, missing_baselines  # noqa: E402
+from databse import Database  # noqa: E402
+
+
+def fill(db, users, per_user, symbols, movers):
+    random.seed(1)
+    tokens = [f"T{i}" for i in range(symbols)]
+    levels = {token: random.uniform(1, 100) for token in tokens}
+    favorites, prices, rules = [], [], []
+    for user_id in range(1, users + 1):
+        for token in random.sample(tokens, per_user):
+            favorites.append((user_id, "Binance", token))
+            prices.append((user_id, "Binance", token, levels[token] * random.uniform(0.99, 1.01)))
+            if len(favorites) % 10 == 0:
+                rules.append((user_id, "Binance", token, 2.5, random.choice(("up", "down", "both")), 0))
+    db.cursor.executemany("INSERT INTO favorites (user_id, source, token) VALUES (?, ?, ?)", favorites)
+    db.cursor.executemany("INSERT INTO prices (user_id, source, token, price) VALUES (?, ?, ?, ?)", prices[len(prices) // 100:])
+    db.cursor.executemany(
+        "INSERT INTO alert_rules (user_id, source, token, threshold, direction, cooldown) VALUES (?, ?, ?, ?, ?, ?)", rules
+    )
+    db.conn.commit()
+    moved = set(random.sample(tokens, int(symbols * movers)))
+    return {"Binance": {token: level * (1.1 if token in moved else random.uniform(0.99, 1.01)) for token, level in levels.items()}}
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def per_user_loop(db, source_prices):
+    """The cycle before batching: a few queries per user and one per favorite, one commit per alert."""
+    alerts = []
+    db.cursor.execute("SELECT DISTINCT user_id FROM favorites")
+    for (user_id,) in db.cursor.fetchall():
+        source = db.get_active_source(user_id)
+        for token in db.get_favorites(user_id, source):
+            old = db.get_last_price(user_id, token, source)
+            new = lookup_price(source_prices, source, token)
+            if old is not None and abs(new - old) / old * 100 > ALERT_THRESHOLD:
+                alerts.append((user_id, source, token, old, new))
+                db.update_last_price(user_id, token, new, source)
+    return alerts
+
+
+def main(args):
+    db = Database()
+    source_prices = fill(db, args.users, args.per_user, args.symbols, args.movers)
+
+    rows, load = timed(db.get_alert_rows)
+    alerts, evaluate = timed(evaluate_alerts, rows, source_prices)
+    seeds, seed = timed(missing_baselines, rows, source_prices)
+    print(f"{len(rows)} favorites on {args.symbols} symbols")
+    print(f"get_alert_rows:    {load * 1000:.0f} ms")
+    print(f"evaluate_alerts:   {evaluate * 1000:.0f} ms ({len(alerts)} alerts)")
+    print(f"missing_baselines: {seed * 1000:.0f} ms ({len(seeds)} seeds)")
+    print(f"batched cycle:     {(load + evaluate + seed) * 1000:.0f} ms")
+
+    shard = [("Binance", f"T{i}") for i in range(0, args.symbols, 2)]
+    shard_rows, shard_load = timed(db.get_alert_rows, shard)
+    print(f"get_alert_rows(half of the symbols): {shard_load * 1000:.0f} ms ({len(shard_rows)} rows)")
+
+    old_alerts, loop = timed(per_user_loop, db, source_prices)
+    print(f"per-user loop:     {loop * 1000:.0f} ms ({len(old_alerts)} alerts)")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--per-user", type=int, default=10, help="favorites per user")
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--movers", type=float, default=0.02, help="fraction of symbols moving 10%%")
+    main(parser.parse_args())
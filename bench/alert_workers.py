@@ -0,0 +1,105 @@
+"""
+Sharded alert scan: start_workers with 1, 2 and 4 real worker processes.
+
+Fills a temporary favorites.db with --users users watching 5 of --symbols symbols each
+(1% of the baselines far enough from the stub's quotes to alert) and points the workers'
+bulk ticker request at the stub exchange through BINANCE_TICKERS_URL. For every worker
+count the processes are started with start_workers, exactly as the bot does, and their
+messages are read back over the Listener/Client connection until every shard has
+reported --cycles scan cycles. Reported per worker count:
+  - the time until every shard finished its first cycle, interpreter start included;
+  - the steady cycle time (later cycles, the scan interval subtracted), slowest shard;
+  - the slowest later scan as measured inside the workers, the rows per shard and the
+    alerts received over IPC per cycle (nothing is delivered here, so the baselines stay
+    and the same watches alert every cycle).
+The workers compete for the machine's cores: with fewer cores than workers the shards
+share them and the cycle does not shrink.
+
+    python -m bench.alert_workers [--users 40000] [--symbols 2000] [--workers 1,2,4] [--cycles 3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from bench.common import isolate
+
+isolate()
+os.environ.setdefault("LOG_LEVEL", "WARNING")  # Inherited by the workers
+
+from alert_workers import next_result, start_workers, stop_workers  # noqa: E402
+from bench import stub_exchange  # noqa: E402
+from databse import Database  # noqa: E402
+
+INTERVAL = 1
+
+
+def fill(users, symbols):
+    random.seed(22)
+    db = Database()
+    tokens = stub_exchange.make_symbols(symbols)
+    favorites = [(user_id, "Binance", token) for user_id in range(1, users + 1) for token in random.sample(tokens, 5)]
+    db.cursor.executemany("INSERT INTO favorites (user_id, source, token) VALUES (?, ?, ?)", favorites)
+    baselines = [  # 1% of the watches are 10% away from the quote and alert
+        (*favorite, stub_exchange.level(favorite[2]) * (0.9 if random.random() < 0.01 else random.uniform(0.98, 1.02)))
+        for favorite in favorites
+    ]
+    db.cursor.executemany("INSERT INTO prices (user_id, source, token, price) VALUES (?, ?, ?, ?)", baselines)
+    db.conn.commit()
+    db.conn.close()
+    return len(favorites)
+
+
+async def run(shards, cycles):
+    """Starts 'shards' workers and collects their messages until each reported 'cycles' cycles."""
+    started = time.perf_counter()
+    processes, results = start_workers(shards, interval=INTERVAL)
+    reported = {shard: [] for shard in range(shards)}  # shard -> [(arrival, stats)] per cycle
+    alerts = [0] * cycles
+    try:
+        while min(len(stats) for stats in reported.values()) < cycles:
+            message = await asyncio.to_thread(next_result, results, 60)
+            if message is None:
+                raise RuntimeError("no worker message for 60 s")
+            kind, shard, payload, _ = message
+            cycle = len(reported[shard])
+            if kind == "alerts" and cycle < cycles:
+                alerts[cycle] += len(payload)
+            elif kind == "stats":
+                reported[shard].append((time.perf_counter() - started, payload))
+    finally:
+        stop_workers(processes)
+    return reported, alerts
+
+
+async def main(args):
+    favorites = fill(args.users, args.symbols)
+    runner, base = await stub_exchange.start(symbols=args.symbols)
+    os.environ["BINANCE_TICKERS_URL"] = f"{base}/api/v3/ticker/price"
+    print(f"{favorites} favorites on {args.symbols} symbols, {args.cycles} cycles per worker count")
+
+    for shards in args.workers:
+        reported, alerts = await run(shards, args.cycles)
+        first = max(stats[0][0] for stats in reported.values())
+        steady = max(
+            later[0] - earlier[0] - INTERVAL
+            for stats in reported.values() for earlier, later in zip(stats, stats[1:])
+        ) if args.cycles > 1 else float("nan")
+        scan = max(payload["duration"] for stats in reported.values() for _, payload in stats[1:] or stats)
+        rows = [stats[0][1]["rows"] for _, stats in sorted(reported.items())]
+        print(
+            f"{shards} worker(s): first cycle done after {first:.2f}s, steady cycle {steady:.2f}s, "
+            f"slowest scan {scan:.2f}s, rows per shard {rows}, alerts per cycle {alerts}"
+        )
+
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40000)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--workers", type=lambda value: [int(n) for n in value.split(",")], default=[1, 2, 4],
+                        help="comma-separated worker counts")
+    parser.add_argument("--cycles", type=int, default=3, help="scan cycles per worker count (at least 2 for the steady time)")
+    asyncio.run(main(parser.parse_args()))
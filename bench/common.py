@@ -0,0 +1,29 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import tempfile
+
+
+def isolate():
+    """
+    Moves into a fresh temporary directory, so the benchmark's favorites.db, snapshots and
+    indexes never touch the working copy. Call before importing bot (which opens its
+    database at import time).
+    """
+    path = tempfile.mkdtemp(prefix="bench-")
+    os.chdir(path)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:ABCdefGHIjklMNOpqrSTUvwxYZ12345678")  # Never sent anywhere
+    os.environ.setdefault("STREAM_SOURCES", "")
+    return path
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def latency_summary(seconds):
+    """'p50 / p99 / max' of a list of durations, in milliseconds."""
+    return (
+        f"p50 {percentile(seconds, 0.5) * 1000:.2f} ms, p99 {percentile(seconds, 0.99) * 1000:.2f} ms, "
+        f"max {max(seconds) * 1000:.2f} ms"
+    )
@@ -0,0 +1,121 @@
+"""
+Database writes and reads: commit-per-call on the event loop vs AsyncDatabase.
+
+Fills temporary databases with --users users (settings, favorites and baselines),
+then issues --writes concurrent baseline updates three ways: the old class in rollback
+journal mode with one commit per call, the same with WAL and synchronous=NORMAL, and
+AsyncDatabase batching every write of a 10 ms window into one transaction. The inline
+variants run on the event loop, so the longest loop stall is reported as well. Reads
+compare an inline get_last_price with the same query through the reader pool.
+
+    python -m bench.database [--users 50000] [--writes 2000] [--reads 2000]
+"""
+import argparse
+import asyncio
+import random
+import time
+from bench.common import isolate, latency_summary
+
+isolate()
+
+from databse import AsyncDatabase, Database  # noqa: E402
+
+
+class LegacyDatabase(Database):
+    """The class before WAL: default rollback journal and synchronous=FULL."""
+
+    def configure(self):
+        pass
+
+
+def fill(db, users):
+    random.seed(1)
+    tokens = [f"T{i}" for i in range(500)]
+    favorites = [(user_id, "Binance", token) for user_id in range(1, users + 1) for token in random.sample(tokens, 5)]
+    db.cursor.executemany("INSERT INTO settings (user_id, active_source) VALUES (?, 'Binance')", [(u,) for u in range(1, users + 1)])
+    db.cursor.executemany("INSERT INTO favorites (user_id, source, token) VALUES (?, ?, ?)", favorites)
+    db.cursor.executemany("INSERT INTO prices (user_id, source, token, price) VALUES (?, ?, ?, 1.0)", favorites)
+    db.conn.commit()
+    return favorites
+
+
+async def loop_lag(stop, lags):
+    """Records how late a 1 ms timer fires while the event loop is busy."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def inline_writes(db, sample):
+    async def write(user_id, source, token):
+        db.update_last_price(user_id, token, random.uniform(1, 100), source)
+
+    return await measure_writes([write(*favorite) for favorite in sample])
+
+
+async def batched_writes(db, sample):
+    return await measure_writes([
+        db.update_last_price(user_id, token, random.uniform(1, 100), source) for user_id, source, token in sample
+    ])
+
+
+async def measure_writes(writes):
+    stop, lags = asyncio.Event(), []
+    monitor = asyncio.create_task(loop_lag(stop, lags))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*writes)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    return len(writes) / elapsed, max(lags)
+
+
+async def main(args):
+    for setup in (Database(), LegacyDatabase("legacy.db")):
+        favorites = fill(setup, args.users)
+        setup.conn.close()
+    sample = random.sample(favorites, args.writes)
+
+    legacy = LegacyDatabase("legacy.db")
+    rate, lag = await inline_writes(legacy, sample)
+    legacy.conn.close()
+    print(f"commit per call, rollback journal: {rate:8.0f} writes/s, longest loop stall {lag * 1000:.0f} ms")
+
+    wal = Database()
+    rate, lag = await inline_writes(wal, sample)
+    print(f"commit per call, WAL:              {rate:8.0f} writes/s, longest loop stall {lag * 1000:.0f} ms")
+
+    db = AsyncDatabase()
+    rate, lag = await batched_writes(db, sample)
+    print(f"AsyncDatabase batched:             {rate:8.0f} writes/s, longest loop stall {lag * 1000:.1f} ms")
+
+    keys = [random.choice(favorites) for _ in range(args.reads)]
+    inline = []
+    for user_id, source, token in keys:
+        started = time.perf_counter()
+        wal.get_last_price(user_id, token, source)
+        inline.append(time.perf_counter() - started)
+    pooled = []
+    for user_id, source, token in keys:
+        started = time.perf_counter()
+        await db.get_last_price(user_id, token, source)
+        pooled.append(time.perf_counter() - started)
+    print(f"get_last_price inline:      {latency_summary(inline)}")
+    print(f"get_last_price reader pool: {latency_summary(pooled)}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(db.get_last_price(user_id, token, source) for user_id, source, token in keys))
+    print(f"{args.reads} concurrent pooled reads: {args.reads / (time.perf_counter() - started):.0f} reads/s")
+
+    wal.conn.close()
+    await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--writes", type=int, default=2000, help="concurrent baseline updates")
+    parser.add_argument("--reads", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
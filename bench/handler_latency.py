@@ -0,0 +1,67 @@
+"""
+Handler latency while an exchange is slow (price engine on the shared aiohttp session).
+
+A user asks for a cached price through the real dispatcher and handler, first on an idle
+bot, then while many lookups are waiting on a stub exchange that takes --delay seconds
+per response. With the async engine the handler latency stays flat; with blocking
+requests.get every chat would wait for the slow exchange.
+
+    python -m bench.handler_latency [--delay 2] [--slow 200] [--updates 300]
+"""
+import argparse
+import asyncio
+import os
+import time
+from bench.common import isolate, latency_summary
+
+isolate()
+os.environ["PRICE_CACHE_TTL"] = "3600"  # The measured lookup is a cache hit for the whole run
+
+import bot  # noqa: E402
+import price_engine  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from bench import stub_exchange, stub_telegram  # noqa: E402
+
+
+async def measure(updates, first_id):
+    durations = []
+    for i in range(updates):
+        update = Update.model_validate(stub_telegram.message_update(first_id + i, 1000 + i % 50, "BTC"))
+        started = time.perf_counter()
+        await bot.dp.feed_update(bot.bot, update)
+        durations.append(time.perf_counter() - started)
+        await asyncio.sleep(0.002)
+    return durations
+
+
+async def main(args):
+    runner, base = await stub_exchange.start(delay=args.delay)
+    stub_exchange.route(price_engine, base)
+    session = stub_telegram.install(bot.bot)
+    bot.dp.include_router(bot.router)
+    bot.trading_pairs["Binance"] = {"BTC"} | {f"T{i}" for i in range(args.slow)}
+
+    await bot.get_price("BTC", "Binance")  # Warm the cache (one slow request)
+
+    idle = await measure(args.updates, 1)
+    print(f"idle:   {latency_summary(idle)}")
+
+    started = time.perf_counter()
+    slow = [asyncio.create_task(bot.get_price(f"T{i}", "Binance")) for i in range(args.slow)]
+    await asyncio.sleep(0.05)
+    loaded = await measure(args.updates, args.updates + 1)
+    print(f"loaded: {latency_summary(loaded)} ({args.slow} lookups waiting {args.delay}s on the stub)")
+    await asyncio.gather(*slow)
+    print(f"slow lookups finished after {time.perf_counter() - started:.2f}s; {session.calls} Bot API calls")
+
+    await price_engine.close_session()
+    await runner.cleanup()
+    await bot.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=2.0, help="stub exchange response time (s)")
+    parser.add_argument("--slow", type=int, default=200, help="lookups in flight against the slow stub")
+    parser.add_argument("--updates", type=int, default=300, help="measured price requests per phase")
+    asyncio.run(main(parser.parse_args()))
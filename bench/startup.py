@@ -0,0 +1,102 @@
+"""
+Startup time with the trading-pairs snapshot, and the parallel pair-list refresh.
+
+1. Fetches the five pair lists from a stub exchange answering after --delay seconds,
+   one source after another (the old startup) and concurrently (get_all_trading_pairs).
+2. Saves them as the snapshot and starts the real bot.main() in webhook mode against the
+   still slow stub, then posts one message and reports the time until /ready and until
+   the first reply. The live refresh runs in the background and does not delay either.
+
+    python -m bench.startup [--delay 3] [--pairs 2000]
+"""
+import time
+
+process_started = time.perf_counter()
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import os  # noqa: E402
+import socket  # noqa: E402
+from bench.common import isolate  # noqa: E402
+
+isolate()
+with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    PORT = probe.getsockname()[1]
+os.environ.update(RUN_MODE="webhook", WEBHOOK_URL="https://bench.invalid", WEBHOOK_SECRET="bench", PORT=str(PORT), HOST="127.0.0.1")
+
+import aiohttp  # noqa: E402
+import bot  # noqa: E402
+import coingecko_index  # noqa: E402
+import price_engine  # noqa: E402
+import tokens_list  # noqa: E402
+from bench import stub_exchange, stub_telegram  # noqa: E402
+
+imported = time.perf_counter()
+
+
+async def set_webhook(*args, **kwargs):
+    return True
+
+
+async def wait_until_ready(client, started):
+    while True:
+        try:
+            async with client.get(f"http://127.0.0.1:{PORT}/ready") as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.005)
+
+
+async def main(args):
+    runner, base = await stub_exchange.start(delay=args.delay, symbols=args.pairs)
+    for source, url in tokens_list.SOURCES.items():
+        tokens_list.SOURCES[source] = stub_exchange.rewrite(url, base)
+    stub_exchange.route(price_engine, base)
+    coingecko_index.fetch_market_ranks = dict  # Ranking only orders ambiguous symbols; keep it offline
+
+    started = time.perf_counter()
+    for source in tokens_list.SOURCES:
+        await asyncio.to_thread(tokens_list.fetch_trading_pairs, source)
+    print(f"pair lists one after another: {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    pairs = await asyncio.to_thread(tokens_list.get_all_trading_pairs)
+    print(f"pair lists concurrently:      {time.perf_counter() - started:.2f}s ({sum(map(len, pairs.values()))} pairs)")
+
+    tokens_list.save_snapshot(pairs)
+    started = time.perf_counter()
+    tokens_list.load_snapshot()
+    print(f"snapshot load:                {(time.perf_counter() - started) * 1000:.1f} ms ({os.path.getsize(tokens_list.SNAPSHOT_PATH)} bytes)")
+
+    session = stub_telegram.install(bot.bot)
+    bot.bot.set_webhook = set_webhook
+    started = time.perf_counter()
+    main_task = asyncio.create_task(bot.main())
+    async with aiohttp.ClientSession() as client:
+        ready = await wait_until_ready(client, started)
+        update = stub_telegram.message_update(1, 42, "/start")
+        headers = {"X-Telegram-Bot-Api-Secret-Token": "bench"}
+        async with client.post(f"http://127.0.0.1:{PORT}/webhook", json=update, headers=headers) as response:
+            assert response.status == 200
+        while session.calls == 0:
+            await asyncio.sleep(0.001)
+        first_reply = time.perf_counter() - started
+
+    print(f"imports:                      {imported - process_started:.2f}s")
+    print(f"main() -> /ready:             {ready * 1000:.0f} ms")
+    print(f"main() -> first reply:        {first_reply * 1000:.0f} ms (exchanges answering after {args.delay}s)")
+
+    main_task.cancel()
+    await asyncio.gather(main_task, return_exceptions=True)
+    bot.pairs_scheduler.stop()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=3.0, help="stub exchange response time (s)")
+    parser.add_argument("--pairs", type=int, default=2000, help="pairs per source")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""
+Local stub of the exchange REST endpoints used by the bot, with a configurable response delay.
+
+Serves the price and pair-list paths of Binance, CoinGecko, CoinMarketCap, ByBit and OKX
+on one aiohttp server, so benchmarks can point the price engine and the trading-pairs
+refresh at it instead of the real APIs.
+
+Standalone:  python -m bench.stub_exchange --port 8081 --delay 3
+"""
+import argparse
+import asyncio
+import random
+import zlib
+from urllib.parse import urlsplit
+from aiohttp import web
+
+# Hosts of the real APIs, rewritten to the stub by route()
+API_HOSTS = ("api.binance.com", "api.coingecko.com", "pro-api.coinmarketcap.com", "api.bybit.com", "www.okx.com")
+
+DELAY = web.AppKey("delay", float)
+SYMBOLS = web.AppKey("symbols", list)
+
+
+def make_symbols(count):
+    return ["BTC", "ETH", "SOL"] + [f"T{i}" for i in range(max(count - 3, 0))]
+
+
+def level(symbol):
+    """Stable reference price of a symbol (1..100); quotes stay within 1% of it."""
+    return 1 + zlib.crc32(symbol.upper().encode()) % 9900 / 100
+
+
+def _price(symbol):
+    return round(level(symbol) * random.uniform(0.99, 1.01), 4)
+
+
+async def _delayed(request):
+    if request.app[DELAY]:
+        await asyncio.sleep(request.app[DELAY])
+
+
+async def binance_ticker(request):
+    await _delayed(request)
+    symbol = request.query.get("symbol")
+    if symbol:
+        return web.json_response({"symbol": symbol, "price": str(_price(symbol[:-4]))})
+    return web.json_response([{"symbol": f"{s}USDT", "price": str(_price(s))} for s in request.app[SYMBOLS]])
+
+
+async def coingecko_list(request):
+    await _delayed(request)
+    return web.json_response([{"id": s.lower(), "symbol": s.lower(), "name": s} for s in request.app[SYMBOLS]])
+
+
+async def coingecko_price(request):
+    await _delayed(request)
+    ids = request.query.get("ids", "").split(",")
+    return web.json_response({coin_id: {"usd": _price(coin_id)} for coin_id in ids if coin_id})
+
+
+async def cmc_map(request):
+    await _delayed(request)
+    return web.json_response({"data": [{"symbol": s} for s in request.app[SYMBOLS]]})
+
+
+async def cmc_quotes(request):
+    await _delayed(request)
+    symbols = request.query.get("symbol", "").split(",")
+    return web.json_response({"data": {s: {"quote": {"USD": {"price": _price(s)}}} for s in symbols if s}})
+
+
+async def bybit_tickers(request):
+    await _delayed(request)
+    symbol = request.query.get("symbol")
+    symbols = [symbol[:-4]] if symbol else request.app[SYMBOLS]
+    return web.json_response({
+        "retCode": 0,
+        "result": {"list": [{"symbol": f"{s}USDT", "lastPrice": str(_price(s))} for s in symbols]},
+    })
+
+
+async def okx_tickers(request):
+    await _delayed(request)
+    inst_id = request.query.get("instId")
+    symbols = [inst_id[:-5]] if inst_id else request.app[SYMBOLS]
+    return web.json_response({"data": [{"instId": f"{s}-USDT", "last": str(_price(s))} for s in symbols]})
+
+
+def create_app(delay=0.0, symbols=2000):
+    app = web.Application()
+    app[DELAY] = delay
+    app[SYMBOLS] = make_symbols(symbols)
+    app.router.add_get("/api/v3/ticker/price", binance_ticker)
+    app.router.add_get("/api/v3/coins/list", coingecko_list)
+    app.router.add_get("/api/v3/simple/price", coingecko_price)
+    app.router.add_get("/v1/cryptocurrency/map", cmc_map)
+    app.router.add_get("/v1/cryptocurrency/quotes/latest", cmc_quotes)
+    app.router.add_get("/v5/market/tickers", bybit_tickers)
+    app.router.add_get("/api/v5/market/ticker", okx_tickers)
+    app.router.add_get("/api/v5/market/tickers", okx_tickers)
+    return app
+
+
+async def start(delay=0.0, symbols=2000, host="127.0.0.1", port=0):
+    """Starts the stub on the running loop; returns (runner, base URL)."""
+    runner = web.AppRunner(create_app(delay, symbols), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def rewrite(url, base):
+    """Points a real API URL at the stub (same path and query)."""
+    parts = urlsplit(url)
+    if parts.hostname in API_HOSTS:
+        return base + parts.path + (f"?{parts.query}" if parts.query else "")
+    return url
+
+
+def route(price_engine, base):
+    """Sends every price_engine.fetch_json request to the stub at 'base'."""
+    fetch_json = price_engine.fetch_json
+
+    async def routed(url, headers=None, source=None):
+        return await fetch_json(rewrite(url, base), headers, source=source)
+
+    price_engine.fetch_json = routed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before every response")
+    parser.add_argument("--symbols", type=int, default=2000)
+    args = parser.parse_args()
+    web.run_app(create_app(args.delay, args.symbols), host="127.0.0.1", port=args.port)
@@ -0,0 +1,51 @@
+"""
+In-process fake of the Telegram Bot API for benchmarks: answers every method without
+network I/O (sendMessage returns a Message, everything else True).
+"""
+import datetime
+import itertools
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+
+class FakeSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.message_ids = itertools.count(1)
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=next(self.message_ids), date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"), text=method.text,
+            )
+        return True
+
+
+def install(bot):
+    """Replaces the bot's session with a FakeSession, keeping its request middlewares."""
+    session = FakeSession()
+    session.middleware = bot.session.middleware
+    bot.session = session
+    return session
+
+
+def message_update(update_id, user_id, text):
+    """A private-chat message update as Telegram posts it."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+        },
+    }
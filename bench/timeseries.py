@@ -0,0 +1,87 @@
+"""
+Price history store: ingest rate, bytes per sample, range queries and chart rendering.
+
+Records --symbols symbols polled every 5 minutes over --days simulated days through
+TimeSeriesStore.record (one flush per poll, hourly compaction checks included), then
+compacts as if a week had passed so the raw blocks become hourly averages, and times
+24h and full-range queries before and after, plus one /chart rendering.
+
+    python -m bench.timeseries [--symbols 500] [--days 3]
+"""
+import argparse
+import random
+import time
+from bench.common import isolate
+
+isolate()
+
+from chart import render_chart  # noqa: E402
+from timeseries import RAW_RETENTION, TimeSeriesStore  # noqa: E402
+
+POLL_INTERVAL = 300
+QUERY_REPEAT = 200
+
+
+def storage(store):
+    """(resolution, samples, bytes) per resolution."""
+    return store.conn.execute(
+        "SELECT resolution, SUM(count), SUM(LENGTH(data)) FROM price_history GROUP BY resolution"
+    ).fetchall()
+
+
+def report_storage(store, label):
+    for resolution, samples, size in storage(store):
+        name = "raw" if resolution == 0 else f"{resolution}s"
+        print(f"{label}: {name} {samples} samples, {size} bytes ({size / samples:.2f} bytes per sample)")
+
+
+def time_query(store, start, end):
+    started = time.perf_counter()
+    for _ in range(QUERY_REPEAT):
+        times, _ = store.query("Binance", "T7", start, end)
+    return (time.perf_counter() - started) / QUERY_REPEAT, len(times)
+
+
+def main(args):
+    random.seed(24)
+    store = TimeSeriesStore()
+    symbols = [f"T{i}" for i in range(args.symbols)]
+    prices = {symbol: 100.0 for symbol in symbols}
+    now = 1_760_000_000
+    polls = range(now - args.days * 86400, now, POLL_INTERVAL)
+
+    started = time.perf_counter()
+    for timestamp in polls:
+        for symbol in symbols:
+            prices[symbol] *= 1 + random.gauss(0, 0.002)
+        store.record({"Binance": dict(prices)}, timestamp)
+    elapsed = time.perf_counter() - started
+    samples = len(polls) * args.symbols
+    print(
+        f"ingest: {samples} samples in {elapsed:.1f}s, {samples / elapsed:.0f} samples/s, "
+        f"{elapsed / len(polls) * 1000:.0f} ms per {args.symbols}-symbol poll"
+    )
+    report_storage(store, "stored")
+
+    for label, start in (("24h", now - 86400), ("full range", now - args.days * 86400)):
+        duration, points = time_query(store, start, now)
+        print(f"{label} query: {duration * 1000:.2f} ms ({points} points)")
+
+    started = time.perf_counter()
+    png = render_chart(*store.query("Binance", "T7", now - 86400, now), "T7")
+    print(f"chart: {(time.perf_counter() - started) * 1000:.0f} ms ({len(png)} bytes)")
+
+    later = now + RAW_RETENTION + 86400
+    started = time.perf_counter()
+    store.compact(later)
+    print(f"compaction of {args.symbols} symbols: {(time.perf_counter() - started) * 1000:.0f} ms")
+    report_storage(store, "compacted")
+    duration, points = time_query(store, now - args.days * 86400, now)
+    print(f"full range query on hourly blocks: {duration * 1000:.2f} ms ({points} points)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--days", type=int, default=3, help="simulated days of 5-minute polls")
+    main(parser.parse_args())
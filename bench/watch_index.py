@@ -0,0 +1,104 @@
+"""
+In-memory watcher index: load time, memory, tick evaluation and baseline moves.
+
+Loads --watches synthetic watches spread over --symbols symbols (baselines within 3% of
+the price, every fifth watch with a custom rule, 1% without a baseline yet), then a
+single symbol with --hot watchers, and times:
+  - WatcherIndex.load and the memory per watch (nbytes and the traced memory retained);
+  - one tick on the hot symbol through the sorted bands vs checking every watcher;
+  - moving the baselines of all hot watchers at once (set_baselines) and 200 one by one.
+
+    python -m bench.watch_index [--watches 1000000] [--symbols 2000] [--hot 40000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from alert_engine import ALERT_THRESHOLD
+from watch_index import WatcherIndex
+
+
+def make_rows(watches, symbols, price=None):
+    rows = []
+    for user_id in range(watches):
+        token = f"T{random.randrange(symbols)}" if price is None else "BTC"
+        last_price = None if random.random() < 0.01 else (price or 50.0) * random.uniform(0.97, 1.03)
+        if random.random() < 0.2:
+            rule = (random.choice((2.0, 10.0)), random.choice(("up", "down", "both")), 0, None)
+        else:
+            rule = (None, None, None, None)
+        rows.append((user_id, "Binance", token, last_price, *rule))
+    return rows
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def scan_all(index, rows, price):
+    """Checks every watcher of the symbol, as a scan without the sorted bands would."""
+    triggered = []
+    for user_id, source, token, last_price, *_ in rows:
+        if not last_price:
+            continue
+        threshold, direction, _ = index.rules.get((source, token, user_id), (ALERT_THRESHOLD, "both", 0))
+        change = (price - last_price) / last_price * 100
+        if (direction != "down" and change > threshold) or (direction != "up" and -change > threshold):
+            triggered.append((user_id, last_price))
+    return triggered
+
+
+def main(args):
+    random.seed(17)
+    rows = make_rows(args.watches, args.symbols)
+    index = WatcherIndex()
+    _, load = timed(index.load, rows)
+    size = index.nbytes()
+    print(f"load {len(index)} watches on {args.symbols} symbols: {load:.2f}s")
+    print(f"WatcherIndex.nbytes: {size / 2 ** 20:.0f} MiB ({size / len(index):.0f} bytes per watch)")
+
+    # Traced from before the rows exist: like in the bot, the user ids and rule values the
+    # index keeps are objects of the rows, which are dropped after the load
+    del index, rows
+    tracemalloc.start()
+    random.seed(17)
+    rows = make_rows(args.watches, args.symbols)
+    index = WatcherIndex()
+    index.load(rows)
+    del rows
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"retained by the index: {retained / 2 ** 20:.0f} MiB ({retained / len(index):.0f} bytes per watch)")
+
+    hot_rows = make_rows(args.hot, 1, price=100.0)
+    hot = WatcherIndex()
+    _, load = timed(hot.load, hot_rows)
+    print(f"load {args.hot} watchers on one symbol: {load * 1000:.0f} ms")
+
+    watchers = hot.get("Binance", "BTC")
+    for price in (100.0, 108.0):
+        triggered, bands = timed(watchers.triggered, price)
+        expected, scan = timed(scan_all, hot, hot_rows, price)
+        assert sorted(triggered) == sorted(expected)
+        print(
+            f"tick at {price}: {len(triggered)} triggered, bands {bands * 1e6:.0f} us, "
+            f"checking every watcher {scan * 1000:.1f} ms"
+        )
+
+    moves = [(user_id, "Binance", "BTC", 108.0) for user_id, *_ in hot_rows]
+    _, bulk = timed(hot.set_baselines, moves)
+    print(f"move all {args.hot} baselines: {bulk * 1000:.0f} ms")
+    started = time.perf_counter()
+    for user_id in range(200):
+        hot.set_baseline("Binance", "BTC", user_id, 101.0)
+    print(f"200 single baseline moves: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--watches", type=int, default=1_000_000)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--hot", type=int, default=40_000, help="watchers of the single hot symbol")
+    main(parser.parse_args())
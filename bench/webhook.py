@@ -0,0 +1,84 @@
+"""
+Webhook mode throughput: Telegram-style update POSTs through the real HTTP server.
+
+Starts web_server's app in webhook mode with the real dispatcher and handlers (Bot API
+calls answered by the in-process stub), posts --updates /start messages from --users
+users with --concurrency requests in flight, and reports updates/s, the POST latency
+Telegram would see and the handling time per update. A request without the secret
+token must be refused with 401.
+
+    python -m bench.webhook [--updates 5000] [--concurrency 64] [--users 500]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+from bench.common import isolate, latency_summary
+
+isolate()
+with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    PORT = probe.getsockname()[1]
+os.environ.update(RUN_MODE="webhook", WEBHOOK_SECRET="bench")
+
+import aiohttp  # noqa: E402
+import bot  # noqa: E402
+from bench import stub_telegram  # noqa: E402
+from web_server import WEBHOOK_PATH  # noqa: E402
+
+SECRET_HEADER = {"X-Telegram-Bot-Api-Secret-Token": "bench"}
+
+
+async def main(args):
+    handled, done = [], asyncio.Event()
+
+    @bot.dp.update.outer_middleware()
+    async def time_handling(handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handled.append(time.perf_counter() - started)
+            if len(handled) == args.updates:
+                done.set()
+
+    stub_telegram.install(bot.bot)
+    bot.dp.include_router(bot.router)
+    runner = await bot.start_server(bot.create_app(bot.dp, bot.bot, webhook=True), host="127.0.0.1", port=PORT)
+    url = f"http://127.0.0.1:{PORT}{WEBHOOK_PATH}"
+
+    async with aiohttp.ClientSession() as client:
+        async with client.post(url, json=stub_telegram.message_update(0, 1, "/start")) as response:
+            print(f"without the secret token: HTTP {response.status}")
+            assert response.status == 401
+
+        posted, slots = [], asyncio.Semaphore(args.concurrency)
+
+        async def post(update_id):
+            async with slots:
+                update = stub_telegram.message_update(update_id, 1 + update_id % args.users, "/start")
+                started = time.perf_counter()
+                async with client.post(url, json=update, headers=SECRET_HEADER) as response:
+                    assert response.status == 200
+                posted.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(1, args.updates + 1)))
+        await done.wait()
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.updates} updates in {elapsed:.2f}s: {args.updates / elapsed:.0f} updates/s")
+    print(f"POST:     {latency_summary(posted)}")
+    print(f"handling: {latency_summary(handled)}")
+
+    await runner.cleanup()
+    await bot.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight")
+    parser.add_argument("--users", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,215 @@
+"""
+Local WebSocket replay of recorded exchange ticker frames, and a PriceStream benchmark.
+
+The replay server accepts the exchanges' subscribe requests (recording them and sending
+the usual acknowledgement), answers application-level pings, and once a connection has
+subscribed sends the frames of a JSON-lines file in a loop. With --drop-every it closes
+the connection after that many frames, so reconnects and resubscription are exercised.
+
+    python -m bench.ws_replay bench      # PriceStream against the replay: ticks/s, reconnects, resubscription
+    python -m bench.ws_replay serve      # Replay server only: BINANCE_WS_URL=ws://127.0.0.1:8765/ws python bot.py
+    python -m bench.ws_replay record --source Binance --symbols BTC,ETH --seconds 60 --out frames.jsonl
+
+'record' connects to the real stream (network required) and writes its frames in the
+format 'serve' and 'bench' replay. bench/frames/ holds a small Binance miniTicker sample.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import aiohttp
+from aiohttp import web
+from bench.common import isolate
+
+isolate()
+
+import price_engine  # noqa: E402
+from price_stream import STREAM_URLS, PriceStream, parse_ticks, subscribe_messages  # noqa: E402
+
+SAMPLE_FRAMES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frames", "binance_miniticker_sample.jsonl")
+
+FRAMES = web.AppKey("frames", list)
+RATE = web.AppKey("rate", float)
+DROP_EVERY = web.AppKey("drop_every", int)
+STATS = web.AppKey("stats", dict)
+
+
+def load_frames(path):
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def subscribed_symbols(message):
+    """The channels a subscribe request asks for, in any of the three exchange formats."""
+    if message.get("method") == "SUBSCRIBE":
+        return message.get("params", [])
+    if message.get("op") == "subscribe":
+        return [arg if isinstance(arg, str) else arg.get("instId") for arg in message.get("args", [])]
+    return []
+
+
+def acknowledgement(message):
+    if "method" in message:
+        return {"result": None, "id": message.get("id")}
+    if message.get("op") == "ping":
+        return {"op": "pong", "success": True}
+    if "op" in message and "args" in message and isinstance(message["args"][0], dict):
+        return {"event": message["op"], "arg": message["args"][0]}
+    return {"op": message.get("op"), "success": True}
+
+
+async def receive(ws, subscriptions, subscribed):
+    """Reads the client's messages: records subscriptions, acknowledges them and answers pings."""
+    async for msg in ws:
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            continue
+        if msg.data == "ping":
+            await ws.send_str("pong")
+            continue
+        message = json.loads(msg.data)
+        subscriptions.extend(subscribed_symbols(message))
+        await ws.send_json(acknowledgement(message))
+        if subscriptions:
+            subscribed.set()
+
+
+async def replay(request):
+    app = request.app
+    stats = app[STATS]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    stats["connections"] += 1
+    subscriptions = []
+    stats["subscriptions"].append(subscriptions)
+    subscribed = asyncio.Event()
+    reader = asyncio.create_task(receive(ws, subscriptions, subscribed))
+
+    try:
+        await asyncio.wait_for(subscribed.wait(), timeout=30)
+        frames, rate, drop_every = app[FRAMES], app[RATE], app[DROP_EVERY]
+        sent = 0
+        while not ws.closed:
+            await ws.send_str(frames[sent % len(frames)])
+            sent += 1
+            stats["frames"] += 1
+            if drop_every and sent % drop_every == 0:
+                break  # Simulated disconnect
+            if rate:
+                await asyncio.sleep(1 / rate)
+            elif sent % 100 == 0:
+                await asyncio.sleep(0)  # Let the other connections and the reader run
+    except (asyncio.TimeoutError, ConnectionResetError):
+        pass
+    finally:
+        reader.cancel()
+        await ws.close()
+    return ws
+
+
+def create_app(frames, rate=0.0, drop_every=0):
+    app = web.Application()
+    app[FRAMES] = frames
+    app[RATE] = rate
+    app[DROP_EVERY] = drop_every
+    app[STATS] = {"connections": 0, "frames": 0, "subscriptions": []}
+    app.router.add_get("/ws", replay)
+    return app
+
+
+async def start(frames, rate=0.0, drop_every=0, host="127.0.0.1", port=0):
+    """Starts the replay server on the running loop; returns (runner, app, ws URL)."""
+    app = create_app(frames, rate, drop_every)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, app, f"ws://{host}:{port}/ws"
+
+
+async def record(args):
+    """Writes the frames of the real stream of 'source' to a JSON-lines file."""
+    symbols = [symbol.strip().upper() for symbol in args.symbols.split(",") if symbol.strip()]
+    count = 0
+    deadline = time.monotonic() + args.seconds
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(STREAM_URLS[args.source], heartbeat=20) as ws:
+            for message in subscribe_messages(args.source, symbols):
+                await ws.send_json(message)
+            with open(args.out, "w") as file:
+                while time.monotonic() < deadline:
+                    try:
+                        msg = await ws.receive(timeout=deadline - time.monotonic())
+                    except asyncio.TimeoutError:
+                        break
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    if msg.data != "pong" and parse_ticks(args.source, json.loads(msg.data)):
+                        file.write(msg.data + "\n")
+                        count += 1
+    print(f"recorded {count} frames to {args.out}")
+
+
+async def serve(args):
+    runner, _, url = await start(load_frames(args.frames), args.rate, args.drop_every, port=args.port)
+    print(f"replaying {args.frames} on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def bench(args):
+    frames = load_frames(args.frames)
+    symbols = {symbol for frame in frames for symbol, _ in parse_ticks(args.source, json.loads(frame))}
+    runner, app, url = await start(frames, args.rate, args.drop_every)
+
+    ticks = 0
+
+    async def on_tick(source, symbol, price):
+        nonlocal ticks
+        ticks += 1
+
+    stream = PriceStream(args.source, on_tick, url=url)
+    await stream.set_symbols(symbols)
+    started = time.perf_counter()
+    stream.start()
+    await asyncio.sleep(args.seconds)
+    stream.stop()
+    elapsed = time.perf_counter() - started
+
+    stats = app[STATS]
+    resubscribed = sum(1 for channels in stats["subscriptions"] if len(channels) == len(symbols))
+    print(f"{ticks} ticks in {elapsed:.1f}s: {ticks / elapsed:.0f} ticks/s ({stats['frames']} frames sent)")
+    print(f"{stream.reconnects} reconnects, {stats['connections']} connections")
+    print(f"{resubscribed} of {stats['connections']} connections subscribed all {len(symbols)} symbols")
+
+    await price_engine.close_session()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+
+    for name in ("bench", "serve"):
+        command = commands.add_parser(name)
+        command.add_argument("--frames", default=SAMPLE_FRAMES, help="JSON-lines file of recorded frames")
+        command.add_argument("--rate", type=float, default=0.0, help="frames per second per connection (0 = as fast as possible)")
+        command.add_argument("--drop-every", type=int, default=50000 if name == "bench" else 0,
+                             help="close the connection after this many frames (0 = never)")
+    commands.choices["bench"].add_argument("--source", default="Binance", choices=sorted(STREAM_URLS))
+    commands.choices["bench"].add_argument("--seconds", type=float, default=10.0)
+    commands.choices["serve"].add_argument("--port", type=int, default=8765)
+
+    recorder = commands.add_parser("record")
+    recorder.add_argument("--source", default="Binance", choices=sorted(STREAM_URLS))
+    recorder.add_argument("--symbols", default="BTC,ETH,SOL")
+    recorder.add_argument("--seconds", type=float, default=60.0)
+    recorder.add_argument("--out", required=True)
+
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(["bench"])
+    asyncio.run({"bench": bench, "serve": serve, "record": record}[args.command](args))
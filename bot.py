@@ -1,9 +1,10 @@
 import logging
-import requests
 import asyncio
+import time
+import signal
 from aiogram.exceptions import TelegramForbiddenError
 from aiogram import Bot, Dispatcher, Router
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, BotCommand
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, BotCommand, BufferedInputFile
 from aiogram.types import CallbackQuery as CQ
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.enums import ChatType
@@ -11,11 +12,24 @@ from aiogram import F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from databse import Database
-from tokens_list import get_all_trading_pairs
+from databse import AsyncDatabase
+from alert_engine import ALERT_THRESHOLD
+from alert_workers import scan_rows, start_workers, stop_workers, next_result, ALERT_WORKERS, SCAN_INTERVAL
+from watch_index import WatcherIndex
+from tokens_list import TradingPairsScheduler, load_snapshot
+from coingecko_index import load_index as load_coingecko_index
+from price_engine import get_cached_price, price_cache, close_session, fallback_sources, breaker_report
+from price_engine import PAIR_NOT_FOUND, PRICE_ERROR
+from price_stream import PriceStream, STREAM_URLS
+from notifier import Notifier
+from chat_history import ChatHistory, HistoryMiddleware, CLEAR_DEPTH, DELETE_BATCH
 import os
 from dotenv import load_dotenv
-from keep_alive import keep_alive
+from timeseries import TimeSeriesStore
+from chart import parse_period, render_chart
+from web_server import create_app, start_server, READY, RUN_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+import metrics
+from metrics import price_lookup_seconds, price_lookup_errors, alert_cycle_seconds, handler_seconds
 
 load_dotenv()
 
@@ -25,9 +39,9 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 # Bot initialization
 bot = Bot(token=TOKEN)
 dp = Dispatcher()
-db = Database()
+db = AsyncDatabase()
 router = Router()
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())  # Switchable at runtime, see web_server.loglevel
 
 async def set_bot_commands(bot: Bot):
     """
@@ -40,6 +54,10 @@ async def set_bot_commands(bot: Bot):
         BotCommand(command="add", description="Add a token to favorites"),
         BotCommand(command="remove", description="Remove a favorite token"),
         BotCommand(command="list", description="View favorite tokens with prices"),
+        BotCommand(command="alert", description="Set the alert rule of a favorite token"),
+        BotCommand(command="alerts", description="View your alert rules"),
+        BotCommand(command="digest", description="Receive alerts as one summary message"),
+        BotCommand(command="chart", description="Price chart of a favorite token"),
         BotCommand(command="clear", description="Delete chat messages"),
         BotCommand(command="cancel", description="Cancel the current action"),
     ]
@@ -48,34 +66,97 @@ async def set_bot_commands(bot: Bot):
 # Dictionary to store trading pairs data
 trading_pairs = {}
 
-async def update_trading_pairs_periodically():
-    """
-    Function to automatically update trading pairs every 10 minutes.
-    It fetches the latest trading pairs from the data source.
-    """
-    while True:
-        await get_all_trading_pairs()  # Update the list of trading pairs
-        await asyncio.sleep(600)  # Update every 10 minutes (600 seconds)
+# Time (seconds) /list waits for prices before rendering; late prices are edited in afterwards
+LIST_PRICE_DEADLINE = float(os.getenv("LIST_PRICE_DEADLINE", 2))
 
+# References to fire-and-forget tasks, so they are not garbage collected while running
+background_tasks = set()
 
-def get_favorites_keyboard(user_id):
-    """
-    Generates an inline keyboard with the user's favorite tokens and their prices.
-    If there are no valid tokens, it returns None.
-    """
-    active_source = db.get_active_source(user_id)  # Retrieve the user's active price source
-    favorite_tokens = db.get_favorites(user_id, active_source)  # Retrieve favorite tokens for the source
 
-    if not favorite_tokens:  # If the list is empty, return None
-        return None
+def spawn(coro):
+    """Runs 'coro' as a background task that stays referenced until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+# Real-time ticker streams feeding the alerts (STREAM_SOURCES="" disables them)
+STREAM_SOURCES = [src for src in os.getenv("STREAM_SOURCES", "Binance,ByBit,OKX").split(",") if src in STREAM_URLS]
+price_streams = {}
+
+# (source, symbol) pairs whose streamed tick is being checked right now
+ticks_in_progress = set()
+
+# Inverted index (source, symbol) -> watchers and baselines, used to evaluate stream ticks
+watch_index = WatcherIndex()
 
+# (user_id, source, SYMBOL) of alerts queued or buffered for a digest but not delivered yet.
+# Their baseline only moves after delivery, so the ticks in between must not alert again.
+alerts_in_flight = set()
+
+# Users in digest mode get the alerts of DIGEST_WINDOW seconds as one message
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", 60))
+digest_buffers = {}  # user_id -> {(source, token): (old_price, new_price, alerted_at)}
+
+# Price history per (source, symbol), one sample per scan cycle, rendered by /chart
+price_history = TimeSeriesStore()
+
+# Alert worker processes (ALERT_WORKERS) and their last reported cycle, by shard
+alert_workers = []
+worker_stats = {}
+
+# Recent message ids per chat, the bot's own ones are recorded by a session middleware
+chat_history = ChatHistory()
+bot.session.middleware(HistoryMiddleware(chat_history))
+
+# Alerts triggered and messages queued since the last scan cycle log
+alert_stats = {"alerts": 0, "messages": 0}
+
+# Rate-limited outbound queue for alert messages (NOTIFY_WORKERS concurrent senders)
+notifier = Notifier(bot, workers=int(os.getenv("NOTIFY_WORKERS", 8)))
+
+# Background refresh of 'trading_pairs' (one jittered schedule per source)
+pairs_scheduler = TradingPairsScheduler(trading_pairs)
+
+# State read when /metrics is scraped
+metrics.register(metrics.Gauge(
+    "notifier_stats", "Notifier counters and queue length",
+    lambda: {(name,): value for name, value in notifier.stats().items()}, ("stat",)))
+metrics.register(metrics.Gauge(
+    "price_cache_stats", "Price cache counters and size",
+    lambda: {(name,): value for name, value in price_cache.stats().items()}, ("stat",)))
+metrics.register(metrics.Gauge(
+    "price_source_state", "Circuit breaker state of every price source (1 for the current state)",
+    lambda: {(source, stats["state"]): 1 for source, stats in breaker_report().items()}, ("source", "state")))
+metrics.register(metrics.Gauge(
+    "watches", "Watches in the in-memory watcher index", lambda: {(): len(watch_index)}))
+metrics.register(metrics.Gauge(
+    "price_stream_stats", "Ticker stream counters (ticks, reconnects) and subscribed symbols by source",
+    lambda: {(source, name): value for source, stream in price_streams.items() for name, value in stream.stats().items()},
+    ("source", "stat")))
+metrics.register(metrics.Gauge(
+    "price_history_samples", "Price samples recorded since the start", lambda: {(): price_history.samples}))
+
+def build_favorites_keyboard(lookups):
+    """
+    Builds the inline keyboard from the /list price lookups ({token: asyncio.Task}).
+    Tokens whose price is still loading get a ⏳ placeholder; invalid tokens are skipped.
+    Prices quoted by a fallback source are labelled with it.
+    If there are no buttons, it returns None.
+    """
     buttons = []
 
-    for token in favorite_tokens:
-        price = get_price(token, user_id)  # Get the price from the selected source
-        if price in ["Pair does not exist", "Error retrieving price"]:  # Skip invalid tokens
-            continue
-        display_price = f"${price}" if isinstance(price, (int, float)) else "❌"
+    for token, lookup in lookups.items():
+        if not lookup.done():
+            display_price = "⏳"
+        else:
+            price, fallback = lookup.result()
+            if price in (PAIR_NOT_FOUND, PRICE_ERROR):  # Skip invalid tokens
+                continue
+            display_price = f"${price}" if isinstance(price, (int, float)) else "❌"
+            if fallback:
+                display_price += f" ({fallback})"
         buttons.append([InlineKeyboardButton(text=f"{token} | {display_price}", callback_data=f"fav_{token}")])
 
     if not buttons:  # If all tokens were invalid, return None
@@ -84,144 +165,368 @@ def get_favorites_keyboard(user_id):
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_price(symbol, user_id):
+async def get_favorites_keyboard(user_id, active_source):
     """
-    Retrieves the price of 'symbol' for the user 'user_id' from the active price source.
-    CoinGecko is queried using ids={symbol.lower()} (without get_coin_id).
+    Generates an inline keyboard with the user's favorite tokens and their prices
+    on 'active_source'. All prices are requested concurrently and the keyboard is
+    built once LIST_PRICE_DEADLINE expires, even if some prices are still loading.
+
+    Returns:
+        tuple: (keyboard or None, {token: asyncio.Task} with all price lookups)
     """
-    global trading_pairs
-    source = db.get_active_source(user_id)
+    favorite_tokens = await db.get_favorites(user_id, active_source)  # Retrieve favorite tokens for the source
+
+    if not favorite_tokens:  # If the list is empty, return None
+        return None, {}
+
+    lookups = {token: asyncio.create_task(get_price_with_fallback(token, active_source)) for token in favorite_tokens}
+    await asyncio.wait(lookups.values(), timeout=LIST_PRICE_DEADLINE)
 
-    logging.info(f"🔍 Fetching price for '{symbol}' from source '{source}'")
+    return build_favorites_keyboard(lookups), lookups
+
+
+async def update_favorites_keyboard(message, lookups):
+    """
+    Waits for the prices that missed the /list deadline and edits them into the
+    already sent keyboard.
+    """
+    pending = [lookup for lookup in lookups.values() if not lookup.done()]
+    if not pending:
+        return
+
+    await asyncio.wait(pending)
+
+    try:
+        await message.edit_reply_markup(reply_markup=build_favorites_keyboard(lookups))
+    except TelegramBadRequest as e:
+        logging.info(f"⚠ Could not update the favorites list (it may have been deleted): {e}")
+
+
+async def get_price(symbol, source):
+    """
+    Retrieves the price of 'symbol' from the price source 'source'.
+    Callers pass the user's active source they already looked up, so no settings
+    query is made per symbol.
+    The HTTP request is awaited on the shared price engine session, so a slow
+    exchange never blocks other handlers, and recent quotes are served from the
+    process-wide price cache.
+    """
+    logging.debug("🔍 Fetching price for '%s' from source '%s'", symbol, source)
 
     # Ensure trading pairs are loaded and the source key exists
     if not trading_pairs or source not in trading_pairs:
         logging.warning(f"⚠ No trading pair data available for {source}")
-        return "Error retrieving price"
+        price_lookup_errors.inc(source, "no_pairs")
+        return PRICE_ERROR
 
     # Check if the trading pair exists in the source
     if symbol.upper() not in trading_pairs[source]:
-        logging.warning(f"⚠ Pair {symbol} not found in {source}")
-        return "Pair does not exist"
+        logging.debug("⚠ Pair %s not found in %s", symbol, source)
+        price_lookup_errors.inc(source, "not_found")
+        return PAIR_NOT_FOUND
+
+    with price_lookup_seconds.time(source):
+        price = await get_cached_price(source, symbol)
+    if price == PRICE_ERROR:
+        price_lookup_errors.inc(source, "error")
+    elif price == PAIR_NOT_FOUND:
+        price_lookup_errors.inc(source, "not_found")
+    return price
+
 
-    # Define API endpoints for different price sources
-    sources = {
-        "Binance": f"https://api.binance.com/api/v3/ticker/price?symbol={symbol.upper()}USDT",
-        "CoinGecko": f"https://api.coingecko.com/api/v3/simple/price?ids={symbol.lower()}&vs_currencies=usd",
-        "CoinMarketCap": f"https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest?symbol={symbol.upper()}&convert=USD",
-        "ByBit": "https://api.bybit.com/v5/market/tickers?category=spot",
-        "OKX": f"https://www.okx.com/api/v5/market/ticker?instId={symbol.upper()}-USDT"
-    }
+async def get_price_with_fallback(symbol, source):
+    """
+    Like get_price, but when 'source' cannot deliver a quote (down or its circuit breaker
+    is open) the next sources of PRICE_FALLBACK_CHAIN that list the pair are tried.
+    Only for quotes shown to the user; alert baselines always stay on the user's source.
+
+    Returns:
+        tuple: (price or error string, fallback source the price came from or None)
+    """
+    price = await get_price(symbol, source)
+    if price != PRICE_ERROR:
+        return price, None
+
+    for alt in fallback_sources(source):
+        if symbol.upper() not in trading_pairs.get(alt, set()):
+            continue
+        alt_price = await get_cached_price(alt, symbol)
+        if isinstance(alt_price, (int, float)):
+            logging.info(f"🔄 {symbol}: {source} unavailable, quoted from {alt}")
+            return alt_price, alt
+    return price, None
+
+
+def notify_alerts(alerts, when):
+    """
+    Queues the triggered alerts on the notifier without waiting for them to be sent.
+    The baselines of delivered alerts are moved in the background. An alert whose watch
+    already has one in flight is dropped; a pending digest entry takes its newer price.
+    """
+    fresh = []
+    for alert in alerts:
+        user_id, source, token, _, new_price = alert
+        key = (user_id, source, token.upper())
+        if key in alerts_in_flight:
+            entries = digest_buffers.get(user_id)
+            if entries is not None and (source, token) in entries:
+                old_price, _, _ = entries[(source, token)]
+                entries[(source, token)] = (old_price, new_price, when)
+            continue
+        alerts_in_flight.add(key)
+        fresh.append(alert)
+
+    if fresh:
+        spawn(deliver_alerts(fresh, when))
 
-    # Set API headers if using CoinMarketCap (requires an API key)
-    headers = {"X-CMC_PRO_API_KEY": os.getenv("CMC_API_KEY")} if source == "CoinMarketCap" else {}
 
-    # Log the request URL
-    request_url = sources[source]
-    logging.debug(f"📡 Requesting data from {source}: {request_url}")
+def format_alert(source, token, old_price, new_price):
+    return (
+        f"🚨 {token} has changed price on {source}!\n"
+        f"📉 Old price: ${old_price:.2f}\n"
+        f"📈 New price: ${new_price:.2f}"
+    )
+
+
+def format_digest(entries):
+    """One message for all buffered alerts of a user: {(source, token): (old_price, new_price, when)}."""
+    lines = [
+        f"🔹 {token} on {source}: ${old_price:.2f} → ${new_price:.2f} ({(new_price - old_price) / old_price * 100:+.1f}%)"
+        for (source, token), (old_price, new_price, _) in sorted(entries.items(), key=lambda item: item[0][1])
+    ]
+    return f"🚨 {len(lines)} of your tokens changed price:\n" + "\n".join(lines)
+
 
+async def deliver_alerts(alerts, when):
+    """
+    Waits for the alerts to be delivered and moves the baselines of the delivered ones.
+    Alerts of users in digest mode are buffered and sent together by flush_digest, and
+    stay in flight until then.
+    """
+    direct, buffered = [], set()
     try:
-        # Send an API request
-        response = requests.get(request_url, headers=headers, timeout=10)
-        response.raise_for_status()  # Raise an error for non-200 responses
-        data = response.json()
-
-        logging.debug(f"📥 Response from {source}: {data}")
-
-        # Process data based on the selected price source
-        if source == "Binance":
-            price = float(data.get("price", 0))
-            logging.info(f"✅ Binance: {symbol} price = {price}")
-            return price
-
-        elif source == "CoinGecko":
-            # Check if the symbol exists in the response data
-            if symbol.lower() in data and "usd" in data[symbol.lower()]:
-                price = float(data[symbol.lower()]["usd"])
-                logging.info(f"✅ CoinGecko: {symbol} price = {price}")
-                return price
+        for alert in alerts:
+            user_id, source, token, old_price, new_price = alert
+            if await db.get_digest(user_id):
+                buffer_digest(user_id, source, token, old_price, new_price, when)
+                buffered.add((user_id, source, token.upper()))
             else:
-                logging.warning(f"⚠ CoinGecko: '{symbol.lower()}' not found in the response.")
+                direct.append(alert)
+
+        alert_stats["alerts"] += len(direct)
+        alert_stats["messages"] += len(direct)
+        metrics.alerts_triggered.inc(amount=len(direct))
+        metrics.alert_messages.inc(amount=len(direct))
+        results = await asyncio.gather(*(
+            # A newer alert for the same token replaces a queued one
+            notifier.send(user_id, format_alert(source, token, old_price, new_price), key=(source, token))
+            for user_id, source, token, old_price, new_price in direct
+        ))
+
+        # The alerted price becomes the new baseline
+        delivered = [
+            (user_id, source, token, new_price)
+            for (user_id, source, token, _, new_price), ok in zip(direct, results) if ok
+        ]
+        if delivered:
+            await record_alerts(delivered, when)
+            await save_baselines(delivered)
+    finally:
+        # Failed alerts may trigger again on the next tick
+        alerts_in_flight.difference_update({(user_id, source, token.upper()) for user_id, source, token, *_ in alerts} - buffered)
+
+
+def buffer_digest(user_id, source, token, old_price, new_price, when):
+    """Adds an alert to the user's digest; the first alert of a window schedules the flush."""
+    entries = digest_buffers.get(user_id)
+    if entries is None:
+        entries = digest_buffers[user_id] = {}
+        spawn(flush_digest(user_id))
+
+    previous = entries.get((source, token))
+    if previous is None:
+        alert_stats["alerts"] += 1
+        metrics.alerts_triggered.inc()
+    else:
+        old_price = previous[0]  # Keep the baseline the first alert was measured against
+    entries[(source, token)] = (old_price, new_price, when)
 
-        elif source == "CoinMarketCap":
-            price = float(data["data"].get(symbol.upper(), {}).get("quote", {}).get("USD", {}).get("price", 0))
-            logging.info(f"✅ CoinMarketCap: {symbol} price = {price}")
-            return price
 
-        elif source == "ByBit":
-            url = "https://api.bybit.com/v5/market/tickers?category=spot"
+async def flush_digest(user_id):
+    """Sends the alerts buffered for a user during DIGEST_WINDOW as one message."""
+    await asyncio.sleep(DIGEST_WINDOW)
+    entries = digest_buffers.pop(user_id, None)
+    if not entries:
+        return
+
+    try:
+        alert_stats["messages"] += 1
+        metrics.alert_messages.inc()
+        if not await notifier.send(user_id, format_digest(entries), key="digest"):
+            return
 
-            try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()  # Raise an error if status is not 200
-                data = response.json()
+        delivered = [(user_id, source, token, new_price) for (source, token), (_, new_price, _) in entries.items()]
+        await record_alerts(delivered, max(when for _, _, when in entries.values()))
+        await save_baselines(delivered)
+    finally:
+        alerts_in_flight.difference_update((user_id, source, token.upper()) for source, token in entries)
 
-                if data["retCode"] != 0:
-                    logging.error(f"❌ ByBit API error: {data}")
-                    return "Error retrieving price"
 
-                # Search for the token in the trading pairs list
-                for ticker in data["result"]["list"]:
-                    if ticker["symbol"] == f"{symbol.upper()}USDT":
-                        return float(ticker["lastPrice"])
+async def on_user_blocked(user_id):
+    """Dead-letters a user that blocked the bot: stored in the database and dropped from the watcher index."""
+    await db.block_user(user_id, time.time(), "forbidden")
+    active_source = await db.get_active_source(user_id)
+    for token in await db.get_favorites(user_id, active_source):
+        watch_index.remove(active_source, token, user_id)
 
-                return "Pair does not exist"
 
-            except requests.exceptions.RequestException as e:
-                logging.error(f"❌ Request error to {source} for {symbol}: {e}")
-                return "Error retrieving price"
+@dp.update.outer_middleware()
+async def time_updates(handler, event, data):
+    """Measures how long every update takes to handle, by update type (message, callback_query, ...)."""
+    with handler_seconds.time(event.event_type):
+        return await handler(event, data)
 
-        elif source == "OKX":
-            if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
-                price = float(data["data"][0].get("last", 0))
-                logging.info(f"✅ OKX: {symbol} price = {price}")
-                return price
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"❌ Request error from {source} for {symbol}: {e}")
-    except (KeyError, ValueError, TypeError) as e:
-        logging.error(f"❌ Invalid response from {source} for {symbol}: {e}")
+@dp.update.outer_middleware()
+async def unblock_active_users(handler, event, data):
+    """A dead-lettered user who writes to the bot again is alerted again from the next scan on."""
+    user = data.get("event_from_user")
+    if user is not None and user.id in notifier.blocked:
+        notifier.unblock(user.id)
+        await db.unblock_user(user.id)
+    return await handler(event, data)
+
+
+async def on_price_tick(source, symbol, price):
+    """
+    Called by the price streams for every tick. The watchers of the symbol are checked
+    in the background; ticks arriving while a check is still running are skipped,
+    the next tick carries the latest price anyway.
+    """
+    key = (source, symbol)
+    if key in ticks_in_progress:
+        return
+    ticks_in_progress.add(key)
+    spawn(check_tick(source, symbol, price))
+
+
+async def check_tick(source, symbol, price):
+    """
+    Evaluates the watchers of 'symbol' on 'source' against 'price' using the in-memory
+    watcher index: only the triggered ends of the sorted baselines are visited and no
+    database query is made.
+    """
+    try:
+        watchers = watch_index.get(source, symbol)
+        if watchers is None:
+            return
+
+        now = time.time()
+        baselines = [(user_id, source, symbol, price) for user_id in watchers.unseeded]
+        alerts = [
+            (user_id, source, symbol, old_price, price)
+            for user_id, old_price in watchers.triggered(price)
+            if not watch_index.in_cooldown(source, symbol, user_id, now)
+        ]
+        notify_alerts(alerts, now)
+        if baselines:
+            await save_baselines(baselines)
+    except Exception as e:
+        logging.error(f"❌ Error while checking a {source} tick for {symbol}: {e}")
+    finally:
+        ticks_in_progress.discard((source, symbol))
+
+
+async def save_baselines(baselines):
+    """Writes (user_id, source, token, price) baselines in one transaction and mirrors them in the watcher index."""
+    await db.update_last_prices(baselines)
+    watch_index.set_baselines(baselines)
+
+
+async def record_alerts(delivered, when):
+    """Starts the cooldown of the delivered alerts whose rule has one."""
+    rows = [
+        (when, user_id, source, token)
+        for user_id, source, token, _ in delivered
+        if watch_index.rules.get((source, token.upper(), user_id), (None, None, 0))[2]
+    ]
+    if not rows:
+        return
+    await db.mark_alerted(rows)
+    for _, user_id, source, token in rows:
+        watch_index.record_alert(source, token, user_id, when)
+
+
+async def sync_stream_subscriptions():
+    """
+    Keeps every price stream subscribed to exactly the symbols that users watch on it.
+    Runs continuously in a loop with a 1-minute interval.
+    """
+    while True:
+        try:
+            for source, stream in price_streams.items():
+                await stream.set_symbols(watch_index.symbols(source))
+        except Exception as e:
+            logging.error(f"❌ Error while updating stream subscriptions: {e}")
+        await asyncio.sleep(60)
 
-    # Return an error message if price retrieval fails
-    logging.warning(f"⚠ Returning 'Error retrieving price' for {symbol} from {source}")
-    return "Error retrieving price"
 
 async def check_price_changes():
     """
-    Monitors price changes for favorite tokens and notifies users if the price change exceeds 5%.
+    Monitors price changes for favorite tokens and notifies users if the price change exceeds
+    their alert threshold (5% in both directions by default).
     Runs continuously in a loop with a 5-minute interval.
+
+    Each cycle loads all watched tokens with one query, fetches one price table per
+    source and evaluates the threshold for every row in a single vectorized pass (in a
+    worker thread). The watcher index is loaded once at startup and kept in sync by the
+    handlers and save_baselines; it is not rebuilt here.
+    With ALERT_WORKERS > 0 the scan runs in the worker processes and this loop only
+    reports: no favorite is loaded here, the watcher index is kept in sync by the
+    handlers and the baselines the workers send back.
     """
     while True:
-        users = db.get_all_users()  # Retrieve the list of users
-        for user_id in users:
-            active_source = db.get_active_source(user_id)  # Get the user's selected data source
-            tokens = db.get_favorites(user_id, active_source)  # Retrieve favorite tokens for this source
-
-            for token in tokens:
-                old_price = db.get_last_price(user_id, token, active_source)  # Get the last recorded price
-                new_price = get_price(token, user_id)  # Fetch the latest price
-
-                # Skip invalid or non-existent pairs
-                if isinstance(new_price, str) or new_price in ["Pair does not exist", "Error retrieving price"]:
-                    continue  
-
-                new_price = float(new_price)
-
-                # Notify user if the price change exceeds 5%
-                if old_price is not None and abs(new_price - old_price) / old_price * 100 > 5:
-                    try:
-                        await bot.send_message(
-                            user_id,
-                            f"🚨 {token} has changed price on {active_source}!\n"
-                            f"📉 Old price: ${old_price:.2f}\n"
-                            f"📈 New price: ${new_price:.2f}"
-                        )
-                        # Update the last recorded price in the database
-                        db.update_last_price(user_id, token, new_price, active_source)
-                    except TelegramForbiddenError:
-                        logging.warning(f"❌ Could not send a message to user {user_id}, possibly blocked the bot.")
-
-        await asyncio.sleep(300)  # Check price changes every 5 minutes
+        try:
+            started = time.monotonic()
+            if not alert_workers:
+                rows = await db.get_alert_rows()  # (user_id, source, token, last_price, <alert rule>) for every active favorite
+
+                now = time.time()
+                alerts, baselines = await scan_rows(rows, trading_pairs, now, price_history)
+                notify_alerts(alerts, now)  # Sent by the notifier workers, the scan does not wait for Telegram
+
+                if baselines:
+                    await save_baselines(baselines)  # One transaction for all new baselines of the cycle
+
+                duration = time.monotonic() - started
+                alert_cycle_seconds.observe(duration, "bot")
+                logging.info(f"📊 Alert cycle: {len(rows)} favorites, {len(alerts)} alerts in {duration:.2f}s")
+            else:
+                logging.info(f"📊 Alert workers: {worker_stats}")
+            logging.info(f"📊 Price cache stats: {price_cache.stats()}")
+            logging.info(f"📊 Price source breakers: { {source: stats['state'] for source, stats in breaker_report().items()} }")
+            logging.info(f"📊 Alert messages: {alert_stats['messages']} messages for {alert_stats['alerts']} alerts since the last cycle")
+            logging.info(f"📊 Notifier stats: {notifier.stats()}")
+            alert_stats.update(alerts=0, messages=0)
+            logging.info(f"📊 Trading pairs refresh: {pairs_scheduler.report()}")
+        except Exception as e:  # A failed cycle (e.g. a locked database) must not end the alerts
+            logging.error(f"❌ Alert cycle failed: {e}")
+        await asyncio.sleep(SCAN_INTERVAL)  # Check price changes every 5 minutes
+
+async def receive_worker_results(results):
+    """Hands the alerts found by the worker processes to the notifier."""
+    while True:
+        message = await asyncio.to_thread(next_result, results)
+        if message is None:
+            continue
+        kind, shard, payload, now = message
+        if kind == "alerts":
+            notify_alerts(payload, now)
+        elif kind == "baselines":
+            watch_index.set_baselines(payload)  # Seeded by the worker, already stored
+        elif kind == "stats":
+            worker_stats[shard] = payload
+            alert_cycle_seconds.observe(payload["duration"], f"worker-{shard}")
 
 @router.message(Command("start"))
 async def start_command(message: Message):
@@ -235,6 +540,10 @@ async def start_command(message: Message):
         "🔹 `/add <symbol>` — Add a cryptocurrency to your favorites list\n"
         "🔹 `/remove <symbol>` — Remove a cryptocurrency from your favorites list\n"
         "🔹 `/list` — View your favorite tokens and their prices\n"
+        "🔹 `/alert <symbol> <percent> [up|down|both] [cooldown minutes]` — Set a custom price alert\n"
+        "🔹 `/alerts` — View your custom price alerts\n"
+        "🔹 `/digest on|off` — Receive alerts as one summary message\n"
+        "🔹 `/chart <symbol> [24h|7d|1w]` — Price chart of a favorite token\n"
         "🔹 `/cancel` — Cancel the current action\n"
         "🔹 `/clear` — Clear chat history\n\n"
         "📊 Select a command and start using the bot!"
@@ -256,13 +565,15 @@ async def get_crypto_price(message: Message):
         return
 
     # Get the user's active data source
-    active_source = db.get_active_source(user_id)
+    active_source = await db.get_active_source(user_id)
 
-    # Retrieve the price of the entered token
-    price = get_price(symbol, user_id)
+    # Retrieve the price of the entered token (from a fallback source if the active one is down)
+    price, fallback = await get_price_with_fallback(symbol, active_source)
 
-    if price in ["Pair does not exist", "Error retrieving price"]:
+    if price in (PAIR_NOT_FOUND, PRICE_ERROR):
         await message.reply(f"⚠ `{symbol}` was not found on `{active_source}`. Please enter another token.")
+    elif fallback:
+        await message.reply(f"💰 `{symbol}` on `{fallback}` (`{active_source}` is unavailable): `${price}`")
     else:
         await message.reply(f"💰 `{symbol}` on `{active_source}`: `${price}`")
 
@@ -280,21 +591,21 @@ async def clear_chat(message: Message):
         await message.reply("❌ This command only works in a private chat with the bot!")
         return
 
-    deleted_count = 0  # Counter for deleted messages
-    last_message_id = message.message_id  # Start with the latest message ID
-
     try:
-        # Attempt to delete the last 50 messages
-        for msg_id in range(last_message_id, last_message_id - 50, -1):
-            try:
-                await bot.delete_message(chat_id, msg_id)
-                deleted_count += 1
-            except TelegramBadRequest:
-                continue  # Ignore errors if the message cannot be deleted
-
-        # Confirm deletion if messages were removed
-        if deleted_count > 0:
-            confirmation = await message.answer(f"🧹 {deleted_count} messages deleted!")
+        # Known ids of this chat (bot replies and user messages). Right after a restart only the
+        # command itself is known, then the ids below it are probed as before.
+        message_ids = chat_history.recent(chat_id)
+        probing = len(message_ids) <= 1
+        if probing:
+            message_ids = list(range(message.message_id, max(message.message_id - CLEAR_DEPTH, 0), -1))
+        deleted = await delete_messages(chat_id, message_ids)
+        chat_history.forget(chat_id, message_ids)
+
+        # Confirm deletion if messages were removed. A batch is accepted even when some of its ids
+        # no longer exist, so a number is only claimed for ids known to be in the chat.
+        if deleted:
+            text = "🧹 Chat cleared!" if probing else f"🧹 {len(deleted)} messages deleted!"
+            confirmation = await message.answer(text)
             await asyncio.sleep(2)  # Wait 2 seconds before deleting confirmation message
             await confirmation.delete()
         else:
@@ -306,6 +617,37 @@ async def clear_chat(message: Message):
         logging.error(f"❌ Error while clearing chat: {e}")
         await message.reply("❌ Failed to clear chat. Ensure the bot has the necessary permissions.")
 
+async def delete_messages(chat_id, message_ids):
+    """
+    Deletes messages with deleteMessages, up to 100 ids per call. A batch that is rejected
+    falls back to deleting its messages one by one.
+
+    Returns:
+        list: Ids Telegram accepted. Telegram silently skips ids of an accepted batch that no
+              longer exist, so these are only known to be deleted if they were in the chat.
+    """
+    deleted = []
+    for i in range(0, len(message_ids), DELETE_BATCH):
+        batch = message_ids[i:i + DELETE_BATCH]
+        try:
+            await bot.delete_messages(chat_id, batch)
+            deleted.extend(batch)
+        except TelegramBadRequest as e:
+            logging.warning(f"⚠ Batch delete failed in chat {chat_id}, deleting one by one: {e}")
+            for msg_id in batch:
+                try:
+                    await bot.delete_message(chat_id, msg_id)
+                    deleted.append(msg_id)
+                except TelegramBadRequest:
+                    continue  # Ignore errors if the message cannot be deleted
+    return deleted
+
+@dp.message.outer_middleware()
+async def remember_incoming(handler, event, data):
+    """Records the ids of user messages for /clear."""
+    chat_history.add(event.chat.id, event.message_id)
+    return await handler(event, data)
+
 @router.message(Command("cancel"))
 async def cancel_action(message: Message, state: FSMContext):
     """
@@ -338,20 +680,22 @@ async def add_favorite(message: Message):
         return
 
     user_id = message.from_user.id
-    active_source = db.get_active_source(user_id)  # Get the selected data source
+    active_source = await db.get_active_source(user_id)  # Get the selected data source
     
-    price = get_price(symbol, user_id)
-    if price in ["Pair does not exist", "Error retrieving price", None]: 
+    price = await get_price(symbol, active_source)
+    if price in (PAIR_NOT_FOUND, PRICE_ERROR, None): 
         await message.reply(f"⚠ The pair `{symbol}` does not exist on {active_source}. Please enter a different token.")
         return
 
     # Retrieve the user's favorite tokens from the selected source
-    favorites = db.get_favorites(user_id, active_source)
+    favorites = await db.get_favorites(user_id, active_source)
 
     if symbol in favorites:
         await message.reply(f"ℹ `{symbol}` is already in your favorites list ({active_source})!")
     else:
-        db.add_favorite(user_id, symbol, active_source)  # Add token to favorites
+        await db.add_favorite(user_id, symbol, active_source)  # Add token to favorites
+        await db.update_last_price(user_id, symbol, price, active_source)  # Current price is the alert baseline
+        watch_index.add(active_source, symbol, user_id, price)
         await message.reply(f"✅ `{symbol}` has been added to your favorites on `{active_source}`!\n💰 Current price: `${price}`")
 
 @router.message(Command('remove'))
@@ -366,11 +710,140 @@ async def remove_favorite(message: Message):
 
     symbol = args[1].upper()
     user_id = message.from_user.id
-    active_source = db.get_active_source(user_id)  # Retrieve the selected data source
+    active_source = await db.get_active_source(user_id)  # Retrieve the selected data source
 
-    db.remove_favorite(user_id, symbol, active_source)  # Remove token only from this source
+    await db.remove_favorite(user_id, symbol, active_source)  # Remove token only from this source
+    watch_index.remove(active_source, symbol, user_id)
     await message.reply(f"✅ `{symbol}` has been removed from your favorites on `{active_source}`!")
 
+ALERT_DIRECTIONS = ("up", "down", "both")
+MAX_ALERT_COOLDOWN_MINUTES = 7 * 24 * 60  # One week
+
+@router.message(Command('alert'))
+async def set_alert(message: Message):
+    """
+    Sets a custom alert rule for a favorite token on the active source:
+    /alert <symbol> <percent> [up|down|both] [cooldown minutes], or /alert <symbol> reset.
+    """
+    usage = "❗ Usage: `/alert BTC 3 up 60` (percent, direction `up`/`down`/`both`, cooldown in minutes, up to a week) or `/alert BTC reset`"
+    args = message.text.split()
+    if len(args) < 3:
+        await message.reply(usage)
+        return
+
+    symbol = args[1].upper()
+    user_id = message.from_user.id
+    active_source = await db.get_active_source(user_id)
+
+    if symbol not in await db.get_favorites(user_id, active_source):
+        await message.reply(f"⚠ `{symbol}` is not in your favorites on `{active_source}`. Add it first with `/add {symbol}`.")
+        return
+
+    baseline = await db.get_last_price(user_id, symbol, active_source)
+    if args[2].lower() == "reset":
+        await db.delete_alert_rule(user_id, symbol, active_source)
+        watch_index.set_rule(active_source, symbol, user_id, baseline)
+        await message.reply(f"✅ `{symbol}` on `{active_source}` is back to the default alert (±{ALERT_THRESHOLD}%).")
+        return
+
+    try:
+        threshold = float(args[2].rstrip("%"))
+        direction = args[3].lower() if len(args) > 3 else "both"
+        cooldown_minutes = float(args[4]) if len(args) > 4 else 0.0
+        # 'nan' and 'inf' parse as floats; the cooldown is capped so it stays a sane integer of seconds
+        if not 0 <= cooldown_minutes <= MAX_ALERT_COOLDOWN_MINUTES:
+            raise ValueError(f"cooldown out of range: {args[4]}")
+        cooldown = int(cooldown_minutes * 60)
+    except (ValueError, OverflowError):
+        await message.reply(usage)
+        return
+
+    if not 0 < threshold < 100 or direction not in ALERT_DIRECTIONS:
+        await message.reply(usage)
+        return
+
+    await db.set_alert_rule(user_id, symbol, active_source, threshold, direction, cooldown)
+    watch_index.set_rule(active_source, symbol, user_id, baseline, threshold, direction, cooldown)
+    cooldown_text = f", at most once every {cooldown // 60} min" if cooldown else ""
+    await message.reply(f"✅ Alert for `{symbol}` on `{active_source}`: {direction} {threshold:g}%{cooldown_text}")
+
+@router.message(Command('alerts'))
+async def list_alerts(message: Message):
+    """
+    Lists the custom alert rules of the user on the active source.
+    """
+    user_id = message.from_user.id
+    active_source = await db.get_active_source(user_id)
+    rules = await db.get_alert_rules(user_id, active_source)
+
+    if not rules:
+        await message.reply(f"ℹ No custom alerts on `{active_source}`, all favorites alert at ±{ALERT_THRESHOLD}%.")
+        return
+
+    lines = [
+        f"🔹 `{token}` — {direction} {threshold:g}%" + (f", cooldown {cooldown // 60} min" if cooldown else "")
+        for token, threshold, direction, cooldown, _ in rules
+    ]
+    await message.reply(f"🔔 Your alerts on `{active_source}`:\n" + "\n".join(lines))
+
+@router.message(Command('digest'))
+async def set_digest(message: Message):
+    """
+    Shows or changes the digest mode: /digest on|off.
+    """
+    user_id = message.from_user.id
+    args = message.text.split()
+
+    if len(args) < 2:
+        enabled = await db.get_digest(user_id)
+        await message.reply(f"ℹ Digest mode is {'on' if enabled else 'off'}. Use `/digest on` or `/digest off`.")
+        return
+
+    choice = args[1].lower()
+    if choice not in ("on", "off"):
+        await message.reply("❗ Usage: `/digest on` or `/digest off`")
+        return
+
+    await db.update_digest(user_id, choice == "on")
+    if choice == "on":
+        await message.reply(f"✅ Digest mode on: alerts are collected for {DIGEST_WINDOW:g}s and sent as one message.")
+    else:
+        await message.reply("✅ Digest mode off: every alert is sent right away.")
+
+@router.message(Command('chart'))
+async def send_chart(message: Message):
+    """
+    Sends a price chart of a favorite token on the active source: /chart BTC 24h.
+    The history is recorded by the alert scan for every watched token.
+    """
+    args = message.text.split()
+    if len(args) < 2:
+        await message.reply("❗ Please specify a token symbol! Example: `/chart BTC 24h`")
+        return
+
+    symbol = args[1].upper()
+    period = parse_period(args[2]) if len(args) > 2 else 86400
+    if period is None:
+        await message.reply("⚠ Invalid period. Use hours, days or weeks up to a year, e.g. `24h`, `7d`, `2w`.")
+        return
+
+    user_id = message.from_user.id
+    active_source = await db.get_active_source(user_id)
+
+    now = time.time()
+    times, prices = await asyncio.to_thread(price_history.query, active_source, symbol, now - period, now)
+    if len(times) < 2:
+        await message.reply(f"ℹ No price history for `{symbol}` on `{active_source}` yet. History is recorded for favorite tokens.")
+        return
+
+    label = args[2] if len(args) > 2 else "24h"
+    image = await asyncio.to_thread(render_chart, times, prices, f"{symbol} on {active_source} ({label})")
+    change = (prices[-1] - prices[0]) / prices[0] * 100
+    await message.answer_photo(
+        BufferedInputFile(image, filename=f"{symbol}.png"),
+        caption=f"📈 {symbol} on {active_source}: ${prices[-1]:g} ({change:+.2f}% over {label})",
+    )
+
 
 # 🔹 Create a state for waiting for token input
 class TokenState(StatesGroup):
@@ -383,13 +856,15 @@ async def send_favorites(message: Message, state: FSMContext):
     If there are no favorites, prompts the user to enter a token.
     """
     user_id = message.from_user.id
-    active_source = db.get_active_source(user_id)  # Retrieve the active source
-    keyboard = get_favorites_keyboard(user_id)  # Retrieve the tokens for this source
+    active_source = await db.get_active_source(user_id)  # Retrieve the active source
+    keyboard, lookups = await get_favorites_keyboard(user_id, active_source)  # Retrieve the tokens for this source
 
     if not keyboard:
         await message.reply(f"📊 Your active source: {active_source}\n⚠ No favorite tokens found for this source. Please enter a token:")
     else:
-        await message.reply(f"📊 Your active source: {active_source}\n🔽 Select a token or enter a new one:", reply_markup=keyboard)
+        sent_message = await message.reply(f"📊 Your active source: {active_source}\n🔽 Select a token or enter a new one:", reply_markup=keyboard)
+        # Prices that missed the deadline are filled in when they arrive
+        spawn(update_favorites_keyboard(sent_message, lookups))
 
     await state.set_state(TokenState.waiting_for_token)  # Set the state
 
@@ -401,31 +876,33 @@ async def process_token_input(message: Message, state: FSMContext):
     """
     user_id = message.from_user.id
     token = message.text.strip().upper()
-    active_source = db.get_active_source(user_id)
-    price = get_price(token, user_id)
+    active_source = await db.get_active_source(user_id)
+    price = await get_price(token, active_source)
 
-    if price == "The pair does not exist":  # If the token is not available on the active source
+    if price == PAIR_NOT_FOUND:  # If the token is not available on the active source
         await message.reply(f"⚠ `{token}` does not exist on `{active_source}`. Please enter another token:")
-    elif price == "Error while getting price":  # If there was an error retrieving the price
+    elif price == PRICE_ERROR:  # If there was an error retrieving the price
         await message.reply("❌ Error retrieving price. Please try again:")
     else:
-        if token in db.get_favorites(user_id, active_source):  # If token is already in favorites
+        if token in await db.get_favorites(user_id, active_source):  # If token is already in favorites
             await message.reply(f"💰 `{token}` on `{active_source}`: `${price}`")
         else:
-            db.add_favorite(user_id, token, active_source)  # Add token to favorites
+            await db.add_favorite(user_id, token, active_source)  # Add token to favorites
+            await db.update_last_price(user_id, token, price, active_source)  # Current price is the alert baseline
+            watch_index.add(active_source, token, user_id, price)
             await message.reply(f"✅ `{token}` has been added to your favorites!\n💰 `{price}`")
 
     await state.clear()  # Clear the FSM state after processing
 
 
-def get_active_source(user_id):
+async def get_active_source(user_id):
     """
     Retrieves the active data source for a given user.
     If no source is found, defaults to "Binance" and updates the database.
     """
-    source = db.get_active_source(user_id)
+    source = await db.get_active_source(user_id)
     if source is None:
-        db.update_active_source(user_id, "Binance")  # Set default source in DB
+        await db.update_active_source(user_id, "Binance")  # Set default source in DB
         return "Binance"
     return source
 
@@ -439,7 +916,7 @@ async def show_sources(message: Message):
     Deletes the previous message before sending a new one.
     """
     user_id = message.from_user.id
-    active_source = db.get_active_source(user_id)
+    active_source = await db.get_active_source(user_id)
 
     # Generate inline keyboard with available sources and mark the active one
     buttons = [
@@ -452,7 +929,7 @@ async def show_sources(message: Message):
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
 
     # Retrieve the last message ID with the sources list from the database
-    last_message_id = db.get_last_source_message(user_id)
+    last_message_id = await db.get_last_source_message(user_id)
 
     # Try to delete the old message before sending a new one
     if last_message_id:
@@ -468,7 +945,7 @@ async def show_sources(message: Message):
     )
     
     # Update the last sent message ID in the database for this user
-    db.update_last_source_message(user_id, sent_message.message_id)
+    await db.update_last_source_message(user_id, sent_message.message_id)
 
 @router.callback_query(F.data.startswith("source_"))
 async def switch_source(call: CQ):
@@ -478,14 +955,27 @@ async def switch_source(call: CQ):
     user_id = call.from_user.id
     new_source = call.data.split("_", 1)[1]  # Extract the selected source name (e.g., Binance, ByBit, OKX)
 
-    current_source = db.get_active_source(user_id)
+    current_source = await db.get_active_source(user_id)
     if new_source == current_source:
         # If the user selects the already active source, show an alert and do nothing
         await call.answer("ℹ This source is already active!", show_alert=True)
         return
 
     # Update the active source in the database
-    db.update_active_source(user_id, new_source)
+    await db.update_active_source(user_id, new_source)
+
+    # Alerts follow the active source: move the user's watches in the watcher index
+    for token in await db.get_favorites(user_id, current_source):
+        watch_index.remove(current_source, token, user_id)
+    rules = {token: rule for token, *rule in await db.get_alert_rules(user_id, new_source)}
+    for token, last_price in await db.get_user_watches(user_id, new_source):
+        if token in rules:
+            *rule, last_alert_at = rules[token]
+            watch_index.set_rule(new_source, token, user_id, last_price, *rule)
+            if last_alert_at:
+                watch_index.record_alert(new_source, token, user_id, last_alert_at)  # Keep the cooldown running
+        else:
+            watch_index.add(new_source, token, user_id, last_price)
     
     # Confirm the source change with a popup message
     await call.answer(f"🔄 Source changed to {new_source}")
@@ -505,51 +995,98 @@ async def switch_source(call: CQ):
     try:
         await call.message.edit_text(new_text, reply_markup=keyboard)
         # Update the last message ID in the database (remains the same in this case)
-        db.update_last_source_message(user_id, call.message.message_id)
+        await db.update_last_source_message(user_id, call.message.message_id)
     except TelegramBadRequest as e:
         # If editing fails (e.g., message not found or outdated), send a new one
         logging.warning(f"⚠ Failed to update the source list message: {e}")
         new_msg = await call.message.answer(new_text, reply_markup=keyboard)
-        db.update_last_source_message(user_id, new_msg.message_id)
+        await db.update_last_source_message(user_id, new_msg.message_id)
 
-async def update_trading_pairs():
+async def wait_for_stop_signal():
     """
-    Periodically updates the list of trading pairs every 10 minutes.
+    Waits for SIGTERM or SIGINT (e.g. a redeploy), so main() returns through its cleanup.
+    In polling mode aiogram handles the signals itself.
     """
-    global trading_pairs
-    while True:
-        trading_pairs = get_all_trading_pairs()  # ✅ Updates the list of trading pairs
-        print(f"✅ Updated list of trading pairs ({len(trading_pairs)} pairs)")
-        await asyncio.sleep(600)  # Updates every 10 minutes
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    await stop.wait()
+    logging.info("🔄 Stop signal received, shutting down...")
+
 
 async def main():
     """
     Main function to start the bot and initialize necessary tasks.
     """
-    keep_alive()
+    started_at = time.monotonic()
 
-    global trading_pairs
+    webhook = RUN_MODE == "webhook"
+    if webhook and not WEBHOOK_URL:  # Checked before anything is started, set_webhook would fail late
+        logging.error(
+            "❌ RUN_MODE=webhook requires the public base URL of the service: "
+            "set WEBHOOK_URL (RENDER_EXTERNAL_URL is used on Render), or use RUN_MODE=polling"
+        )
+        raise SystemExit(1)
 
     dp.include_router(router)  # Include router to the dispatcher
 
-    logging.info("🔄 Loading trading pairs...")
-    
-    try:
-        trading_pairs = get_all_trading_pairs()  # Fetch initial trading pairs
-    except Exception as e:
-        logging.error(f"❌ Error while fetching trading pairs: {e}")
-        return
+    # One aiohttp server on this event loop: health/readiness checks, plus the Telegram webhook in webhook mode
+    app = create_app(dp, bot, webhook=webhook)
+    runner = await start_server(app)
 
-    if not trading_pairs:
-        logging.error("❌ Error: The list of trading pairs is empty!")
-        return
+    load_coingecko_index()  # Symbol -> CoinGecko id index from the previous run
+
+    logging.info("🔄 Loading trading pairs snapshot...")
+    trading_pairs.update(load_snapshot())  # Last good pair sets, the live refresh follows in the background
+
+    if trading_pairs:
+        print(f"✅ Loaded {sum(len(v) for v in trading_pairs.values())} trading pairs from snapshot")
+    else:
+        logging.warning("⚠ No trading pairs snapshot found, prices are available once the first refresh finishes")
+
+    notifier.blocked.update(await db.get_blocked_users())  # Dead-lettered users are not messaged
+    notifier.on_blocked = on_user_blocked
+    notifier.start()
+
+    watch_index.load(await db.get_alert_rows())  # Watchers of every symbol, kept in sync by the handlers
+    logging.info(f"✅ Indexed {len(watch_index)} watches ({watch_index.nbytes() / 1024:.0f} KB)")
 
-    print(f"✅ Loaded {sum(len(v) for v in trading_pairs.values())} trading pairs")
+    if ALERT_WORKERS > 0:  # Scan in separate processes, each owning a consistent-hash shard of the symbols
+        processes, results = start_workers(ALERT_WORKERS)
+        alert_workers.extend(processes)
+        spawn(receive_worker_results(results))
+    spawn(check_price_changes())  # Start monitoring price changes in the background
 
-    asyncio.create_task(check_price_changes())  # Start monitoring price changes in the background
-    asyncio.create_task(update_trading_pairs())  # Periodically update trading pairs
+    for source in STREAM_SOURCES:  # Real-time alerts from the exchange ticker streams
+        price_streams[source] = PriceStream(source, on_price_tick)
+        price_streams[source].start()
+    if price_streams:
+        spawn(sync_stream_subscriptions())
+    pairs_scheduler.start()  # Refresh every source in the background on its own schedule
 
-    await dp.start_polling(bot)  # Start polling the bot
+    try:
+        if webhook:
+            await bot.set_webhook(f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+            app[READY] = True
+            logging.info(f"🚀 Ready to handle webhook updates after {time.monotonic() - started_at:.2f}s")
+            await wait_for_stop_signal()  # Updates arrive through the HTTP server until SIGTERM/SIGINT
+        else:
+            await bot.delete_webhook()  # getUpdates is refused while a webhook is set
+            app[READY] = True
+            logging.info(f"🚀 Ready to handle updates after {time.monotonic() - started_at:.2f}s")
+            await dp.start_polling(bot)  # Start polling the bot
+    finally:
+        await runner.cleanup()
+        for stream in price_streams.values():
+            stream.stop()
+        notifier.stop()
+        stop_workers(alert_workers)
+        await close_session()  # Release pooled exchange connections
+        await db.close()  # Commit pending writes
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
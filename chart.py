@@ -0,0 +1,41 @@
+import io
+from datetime import datetime, timezone
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure  # Figures without pyplot: no GUI backend, safe to render in worker threads
+
+# Longest period /chart accepts, and the units of its argument in seconds
+MAX_CHART_PERIOD = 365 * 86400
+PERIOD_UNITS = {"h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_period(text):
+    """
+    Parses a chart period such as '24h', '7d' or '2w'.
+
+    Returns:
+        int | None: The period in seconds, or None if 'text' is not a valid period.
+    """
+    text = text.strip().lower()
+    if len(text) < 2 or text[-1] not in PERIOD_UNITS or not text[:-1].isdigit():
+        return None
+    seconds = int(text[:-1]) * PERIOD_UNITS[text[-1]]
+    return seconds if 0 < seconds <= MAX_CHART_PERIOD else None
+
+
+def render_chart(times, prices, title):
+    """Renders a price line chart (UTC time axis) and returns it as PNG bytes."""
+    dates = [datetime.fromtimestamp(ts, tz=timezone.utc) for ts in times]
+
+    fig = Figure(figsize=(8, 4), dpi=100)
+    ax = fig.subplots()
+    ax.plot(dates, prices, linewidth=1.5, color="#f7931a")
+    ax.fill_between(dates, prices, min(prices), alpha=0.1, color="#f7931a")
+    ax.set_title(title)
+    ax.set_ylabel("USD")
+    ax.grid(alpha=0.3)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(ax.xaxis.get_major_locator()))
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
@@ -0,0 +1,62 @@
+import os
+from collections import OrderedDict, deque
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Message
+
+# Number of recent message ids remembered per chat, i.e. how far back /clear reaches
+CLEAR_DEPTH = int(os.getenv("CLEAR_DEPTH", 100))
+
+# Message ids accepted by one deleteMessages call
+DELETE_BATCH = 100
+
+
+class ChatHistory:
+    """
+    Recent message ids per chat, both sent by the bot and received from the user,
+    so /clear targets messages that really exist in the chat. Kept in memory only;
+    after a restart /clear falls back to probing ids below the command.
+    """
+
+    def __init__(self, depth=CLEAR_DEPTH, max_chats=50000):
+        self.depth = depth
+        self.max_chats = max_chats
+        self.chats = OrderedDict()  # chat_id -> deque of message ids, least recently active chat first
+
+    def add(self, chat_id, message_id):
+        ids = self.chats.get(chat_id)
+        if ids is None:
+            ids = self.chats[chat_id] = deque(maxlen=self.depth)
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+        ids.append(message_id)
+
+    def recent(self, chat_id):
+        """Returns the remembered message ids of a chat, newest first."""
+        return sorted(set(self.chats.get(chat_id, ())), reverse=True)
+
+    def forget(self, chat_id, message_ids):
+        ids = self.chats.get(chat_id)
+        if ids is not None:
+            removed = set(message_ids)
+            remaining = [message_id for message_id in ids if message_id not in removed]
+            ids.clear()
+            ids.extend(remaining)
+
+
+class HistoryMiddleware(BaseRequestMiddleware):
+    """Bot session middleware recording the id of every message the bot sends."""
+
+    def __init__(self, history):
+        self.history = history
+
+    async def __call__(self, make_request, bot, method):
+        result = await make_request(bot, method)
+        if isinstance(result, Message):
+            self.history.add(result.chat.id, result.message_id)
+        elif isinstance(result, list):  # sendMediaGroup
+            for message in result:
+                if isinstance(message, Message):
+                    self.history.add(message.chat.id, message.message_id)
+        return result
@@ -0,0 +1,81 @@
+import logging
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Health tracker of one price source.
+
+    After 'failure_threshold' consecutive failures the breaker opens and requests fail
+    immediately instead of waiting for the timeout. After 'reset_timeout' seconds a single
+    probe request is let through (half-open): success closes the breaker, failure opens it
+    again for another 'reset_timeout'.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+
+        # Counters for monitoring
+        self.opens = 0
+        self.rejected = 0
+        self.probes = 0
+        self.last_error = None
+
+    def allow(self):
+        """Returns True if a request may be sent now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.probing = False
+        # Exactly one probe at a time, everybody else still fails fast (a probe that never reported back is replaced)
+        if self.state == HALF_OPEN and (not self.probing or time.monotonic() - self.probe_started > self.reset_timeout):
+            self.probing = True
+            self.probe_started = time.monotonic()
+            self.probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def is_open(self):
+        """True while requests would be rejected (probe window not reached yet)."""
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logging.info(f"✅ {self.name} recovered, closing its circuit breaker")
+        self.state = CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self, error=None):
+        self.failures += 1
+        self.last_error = (str(error) or type(error).__name__) if error is not None else None
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opens += 1
+                logging.warning(f"⚠ {self.name} is failing ({self.failures} errors), failing fast for {self.reset_timeout}s")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+            "probes": self.probes,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import requests
+
+# File where the symbol -> CoinGecko id index is persisted between restarts
+INDEX_PATH = os.getenv("COINGECKO_INDEX_PATH", "coingecko_ids.json")
+
+# Number of /coins/markets pages (250 coins each) used to rank ambiguous symbols
+MARKET_PAGES = 4
+
+# In-memory index: SYMBOL -> CoinGecko id
+coingecko_ids = {}
+
+# Market cap rank by CoinGecko id, pulled once and kept in the index file
+market_ranks = {}
+
+
+def load_index(path=INDEX_PATH):
+    """
+    Loads the persisted symbol -> id index and market ranks from disk.
+    Returns True if an index was found.
+    """
+    global coingecko_ids, market_ranks
+    if not os.path.exists(path):
+        return False
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        coingecko_ids = data.get("ids", {})
+        market_ranks = data.get("ranks", {})
+        logging.info(f"✅ Loaded {len(coingecko_ids)} CoinGecko ids from {path}")
+        return True
+    except (OSError, ValueError) as e:
+        logging.error(f"❌ Could not read CoinGecko index {path}: {e}")
+        return False
+
+
+def save_index(path=INDEX_PATH):
+    """Writes the index and market ranks to disk."""
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"ids": coingecko_ids, "ranks": market_ranks}, f, separators=(",", ":"))
+    except OSError as e:
+        logging.error(f"❌ Could not save CoinGecko index {path}: {e}")
+
+
+def fetch_market_ranks():
+    """
+    Pulls market cap ranks for the largest coins from /coins/markets.
+    Only done when no ranks are stored yet, because the ranking of ambiguous
+    symbols barely changes over time.
+    """
+    ranks = {}
+    for page in range(1, MARKET_PAGES + 1):
+        try:
+            response = requests.get(
+                "https://api.coingecko.com/api/v3/coins/markets",
+                params={"vs_currency": "usd", "order": "market_cap_desc", "per_page": 250, "page": page},
+                timeout=15,
+            )
+            response.raise_for_status()
+            for coin in response.json():
+                if coin.get("market_cap_rank"):
+                    ranks[coin["id"]] = coin["market_cap_rank"]
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"⚠ CoinGecko: failed to fetch market ranks (page {page}): {e}")
+            break
+        except (KeyError, ValueError, TypeError) as e:
+            logging.warning(f"⚠ CoinGecko: unexpected /coins/markets response: {e}")
+            break
+    return ranks
+
+
+def update_index(coins):
+    """
+    Rebuilds the symbol -> id index from a /coins/list payload and persists it.
+    When several coins share a symbol, the one with the best market cap rank wins;
+    unranked coins fall back to the shortest id.
+    """
+    global coingecko_ids, market_ranks
+    if not market_ranks:
+        market_ranks = fetch_market_ranks()
+
+    best = {}  # SYMBOL -> (sort key, id)
+    for coin in coins:
+        symbol = coin["symbol"].upper()
+        key = (market_ranks.get(coin["id"], float("inf")), len(coin["id"]))
+        if symbol not in best or key < best[symbol][0]:
+            best[symbol] = (key, coin["id"])
+
+    coingecko_ids = {symbol: coin_id for symbol, (_, coin_id) in best.items()}
+    save_index()
+    logging.info(f"✅ Indexed {len(coingecko_ids)} CoinGecko symbols")
+
+
+def resolve_coingecko_id(symbol):
+    """Returns the CoinGecko id for 'symbol' (falls back to the lower-cased symbol)."""
+    return coingecko_ids.get(symbol.upper(), symbol.lower())
@@ -1,12 +1,55 @@
 import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import db_query_seconds, db_write_batch_seconds, db_write_batch_size
 
 class Database:
-    def __init__(self, db_path="favorites.db"):
-        """Initializes the database connection and ensures tables exist."""
+    def __init__(self, db_path="favorites.db", autocommit=True, setup=True):
+        """
+        Initializes the database connection and ensures tables exist.
+        With autocommit=False write methods leave the transaction open, so the caller can
+        commit several writes at once. setup=False skips the schema checks (reader connections).
+        """
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.cursor = self.conn.cursor()
-        self.create_table()
-        self.ensure_columns_exist()
+        self.autocommit = autocommit
+        self.configure()
+        if setup:
+            self.create_table()
+            self.ensure_columns_exist()
+
+    # Queries on the scanner hot path; check_query_plans() verifies the index each of them searches
+    LAST_PRICE_QUERY = "SELECT price FROM prices WHERE user_id = ? AND source = ? AND token = ?"
+    WATCHED_SYMBOLS_QUERY = "SELECT source, token, COUNT(*) FROM favorites GROUP BY source, token"
+    ALERT_ROWS_QUERY = """
+        SELECT f.user_id, f.source, f.token, p.price, r.threshold, r.direction, r.cooldown, r.last_alert_at
+        FROM {shard}favorites f
+        LEFT JOIN settings s ON s.user_id = f.user_id
+        LEFT JOIN prices p ON p.user_id = f.user_id AND p.source = f.source AND p.token = f.token
+        LEFT JOIN alert_rules r ON r.user_id = f.user_id AND r.source = f.source AND r.token = f.token
+        LEFT JOIN blocked_users b ON b.user_id = f.user_id
+        WHERE f.source = COALESCE(s.active_source, 'Binance') AND b.user_id IS NULL {shard_filter}
+    """
+    # The shard is the outer loop (CROSS JOIN fixes the order), so the favorites index is searched per symbol
+    SHARD_ALERT_ROWS_QUERY = ALERT_ROWS_QUERY.format(
+        shard="shard_symbols q CROSS JOIN ", shard_filter="AND f.source = q.source AND f.token = q.token"
+    )
+
+    def configure(self):
+        """Enables WAL so readers never block the writer, and relaxes fsync to once per checkpoint."""
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.execute("PRAGMA busy_timeout=5000")
+        self.cursor.execute("PRAGMA temp_store=MEMORY")
+        self.cursor.execute("PRAGMA cache_size=-16000")  # ~16 MB page cache per connection
+
+    def commit(self):
+        """Commits the current transaction unless writes are being batched by the caller."""
+        if self.autocommit:
+            self.conn.commit()
 
     def create_table(self):
         """Creates the necessary tables if they do not exist."""
@@ -36,6 +79,29 @@ class Database:
                 last_message_id INTEGER DEFAULT NULL
             )
         """)
+
+        # Custom alert rules; favorites without a row use the default threshold in both directions
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS alert_rules (
+                user_id INTEGER,
+                source TEXT,
+                token TEXT,
+                threshold REAL,
+                direction TEXT DEFAULT 'both',
+                cooldown INTEGER DEFAULT 0,
+                last_alert_at REAL DEFAULT NULL,
+                PRIMARY KEY (user_id, source, token)
+            )
+        """)
+
+        # Dead letters: users the bot can no longer message (e.g. they blocked it); skipped by the alert scan
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_users (
+                user_id INTEGER PRIMARY KEY,
+                blocked_at REAL,
+                reason TEXT
+            )
+        """)
         self.conn.commit()
 
     def ensure_columns_exist(self):
@@ -47,6 +113,15 @@ class Database:
             self.cursor.execute("ALTER TABLE settings ADD COLUMN last_message_id INTEGER DEFAULT NULL")
             self.conn.commit()
 
+        if "digest" not in columns:
+            self.cursor.execute("ALTER TABLE settings ADD COLUMN digest INTEGER DEFAULT 0")
+            self.conn.commit()
+
+        # Covering indexes for the (source, token) -> users fan-out of the alert scanner
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_favorites_source_token ON favorites (source, token, user_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_prices_source_token ON prices (source, token, user_id, price)")
+        self.conn.commit()
+
     def update_last_source_message(self, user_id, message_id):
         """Updates the last message ID containing sources for a user."""
         self.cursor.execute("""
@@ -54,7 +129,7 @@ class Database:
             VALUES (?, ?)
             ON CONFLICT(user_id) DO UPDATE SET last_message_id = excluded.last_message_id
         """, (user_id, message_id))
-        self.conn.commit()
+        self.commit()
 
     def get_last_source_message(self, user_id):
         """Retrieves the `message_id` of the last message containing sources."""
@@ -62,15 +137,51 @@ class Database:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
-    def get_all_users(self):
-        """Retrieves a list of all users who have favorite tokens."""
-        self.cursor.execute("SELECT DISTINCT user_id FROM favorites")
-        return [row[0] for row in self.cursor.fetchall()]
+    def get_watched_symbols(self):
+        """
+        Retrieves every (source, token) watched by at least one user, with its number of
+        watchers: a list of (source, token, watchers) tuples.
+        """
+        self.cursor.execute(self.WATCHED_SYMBOLS_QUERY)
+        return self.cursor.fetchall()
+
+    def get_alert_rows(self, symbols=None):
+        """
+        Retrieves every favorite of the users' active sources together with its last stored price
+        and alert rule in a single query: a list of
+        (user_id, source, token, last_price, threshold, direction, cooldown, last_alert_at) tuples.
+        The rule columns are None for favorites without a custom alert rule. Blocked users are left out.
+        'symbols' limits the rows to the given (source, token) pairs (one alert worker's shard).
+        """
+        if symbols is None:
+            self.cursor.execute(self.ALERT_ROWS_QUERY.format(shard="", shard_filter=""))
+            return self.cursor.fetchall()
+
+        self.create_shard_table()
+        self.cursor.execute("DELETE FROM shard_symbols")
+        self.cursor.executemany("INSERT OR IGNORE INTO shard_symbols (source, token) VALUES (?, ?)", symbols)
+        self.cursor.execute(self.SHARD_ALERT_ROWS_QUERY)
+        rows = self.cursor.fetchall()
+        self.conn.commit()
+        return rows
+
+    def create_shard_table(self):
+        """Creates the connection's temporary table of shard symbols used by get_alert_rows."""
+        self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS shard_symbols (source TEXT, token TEXT, PRIMARY KEY (source, token))")
+
+    def get_user_watches(self, user_id, source):
+        """Retrieves (token, last_price) for every favorite of a user on 'source'."""
+        self.cursor.execute("""
+            SELECT f.token, p.price
+            FROM favorites f
+            LEFT JOIN prices p ON p.user_id = f.user_id AND p.source = f.source AND p.token = f.token
+            WHERE f.user_id = ? AND f.source = ?
+        """, (user_id, source))
+        return self.cursor.fetchall()
 
     def get_last_price(self, user_id, token, source):
         """Retrieves the last stored price for a user's token from a specific source."""
-        self.cursor.execute("SELECT price FROM prices WHERE user_id = ? AND token = ? AND source = ?", 
-                            (user_id, token, source))
+        self.cursor.execute(self.LAST_PRICE_QUERY, (user_id, source, token))
         row = self.cursor.fetchone()
         return row[0] if row else None
 
@@ -81,7 +192,19 @@ class Database:
             VALUES (?, ?, ?, ?) 
             ON CONFLICT(user_id, source, token) DO UPDATE SET price = excluded.price
         """, (user_id, source, token, price))
-        self.conn.commit()
+        self.commit()
+
+    def update_last_prices(self, rows):
+        """
+        Upserts many baseline prices in a single transaction.
+        'rows' is an iterable of (user_id, source, token, price) tuples.
+        """
+        self.cursor.executemany("""
+            INSERT INTO prices (user_id, source, token, price)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, source, token) DO UPDATE SET price = excluded.price
+        """, rows)
+        self.commit()  # One commit for the whole batch
 
     def get_active_source(self, user_id):
         """Retrieves the active data source for a user (defaults to Binance)."""
@@ -96,7 +219,22 @@ class Database:
             VALUES (?, ?) 
             ON CONFLICT(user_id) DO UPDATE SET active_source = excluded.active_source
         """, (user_id, source))
-        self.conn.commit()
+        self.commit()
+
+    def get_digest(self, user_id):
+        """Returns True if the user receives alerts as one digest message per window."""
+        self.cursor.execute("SELECT digest FROM settings WHERE user_id = ?", (user_id,))
+        row = self.cursor.fetchone()
+        return bool(row and row[0])
+
+    def update_digest(self, user_id, enabled):
+        """Turns digest mode on or off for a user."""
+        self.cursor.execute("""
+            INSERT INTO settings (user_id, digest)
+            VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET digest = excluded.digest
+        """, (user_id, int(enabled)))
+        self.commit()
 
     def get_favorites(self, user_id, source):
         """Retrieves a list of favorite tokens for a user from a specific source."""
@@ -110,14 +248,348 @@ class Database:
             VALUES (?, ?, ?)
             ON CONFLICT(user_id, source, token) DO NOTHING
         """, (user_id, source, token))
-        self.conn.commit()
+        self.commit()
 
     def remove_favorite(self, user_id, token, source):
         """Removes a token from the user's favorites list."""
         self.cursor.execute("DELETE FROM favorites WHERE user_id = ? AND source = ? AND token = ?", 
                             (user_id, source, token))
-        self.conn.commit()
+        self.cursor.execute("DELETE FROM alert_rules WHERE user_id = ? AND source = ? AND token = ?",
+                            (user_id, source, token))
+        self.commit()
+
+    def set_alert_rule(self, user_id, token, source, threshold, direction="both", cooldown=0):
+        """Creates or replaces the alert rule of a user's token (cooldown in seconds)."""
+        self.cursor.execute("""
+            INSERT INTO alert_rules (user_id, source, token, threshold, direction, cooldown)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, source, token) DO UPDATE SET
+                threshold = excluded.threshold, direction = excluded.direction, cooldown = excluded.cooldown
+        """, (user_id, source, token, threshold, direction, cooldown))
+        self.commit()
+
+    def delete_alert_rule(self, user_id, token, source):
+        """Removes the alert rule of a user's token, restoring the default alert."""
+        self.cursor.execute("DELETE FROM alert_rules WHERE user_id = ? AND source = ? AND token = ?",
+                            (user_id, source, token))
+        self.commit()
+
+    def get_alert_rules(self, user_id, source):
+        """Retrieves (token, threshold, direction, cooldown, last_alert_at) for every alert rule of a user on 'source'."""
+        self.cursor.execute("""
+            SELECT token, threshold, direction, cooldown, last_alert_at FROM alert_rules
+            WHERE user_id = ? AND source = ? ORDER BY token
+        """, (user_id, source))
+        return self.cursor.fetchall()
+
+    def mark_alerted(self, rows):
+        """
+        Stores the time of the last alert for rules with a cooldown.
+        'rows' is an iterable of (last_alert_at, user_id, source, token) tuples.
+        """
+        self.cursor.executemany("""
+            UPDATE alert_rules SET last_alert_at = ?
+            WHERE user_id = ? AND source = ? AND token = ? AND cooldown > 0
+        """, rows)
+        self.commit()
+
+    def block_user(self, user_id, blocked_at, reason):
+        """Records a user that can no longer be messaged."""
+        self.cursor.execute("""
+            INSERT INTO blocked_users (user_id, blocked_at, reason)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET blocked_at = excluded.blocked_at, reason = excluded.reason
+        """, (user_id, blocked_at, reason))
+        self.commit()
+
+    def unblock_user(self, user_id):
+        """Removes a user from the blocked list."""
+        self.cursor.execute("DELETE FROM blocked_users WHERE user_id = ?", (user_id,))
+        self.commit()
+
+    def get_blocked_users(self):
+        """Retrieves the ids of all blocked users."""
+        self.cursor.execute("SELECT user_id FROM blocked_users")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def check_query_plans(self):
+        """
+        Runs EXPLAIN QUERY PLAN on the scanner queries and returns the problems found (an empty
+        list means every query uses its index): an expected plan step that is missing, e.g. a
+        SEARCH that became a scan after an index was dropped, or an unexpected SCAN / temp B-tree.
+        """
+        self.create_shard_table()
+        queries = {
+            "get_last_price": (self.LAST_PRICE_QUERY, (0, "", ""), [
+                "SEARCH prices USING INDEX sqlite_autoindex_prices_1",
+            ]),
+            # Reads every watched symbol by design, but only from the covering index and without sorting
+            "get_watched_symbols": (self.WATCHED_SYMBOLS_QUERY, (), [
+                "SCAN favorites USING COVERING INDEX idx_favorites_source_token",
+            ]),
+            # The default scanner reads every favorite once, then joins each row through a primary key
+            "get_alert_rows": (self.ALERT_ROWS_QUERY.format(shard="", shard_filter=""), (), [
+                "SCAN f",
+                "SEARCH s USING INTEGER PRIMARY KEY",
+                "SEARCH p USING INDEX sqlite_autoindex_prices_1",
+                "SEARCH r USING INDEX sqlite_autoindex_alert_rules_1",
+                "SEARCH b USING INTEGER PRIMARY KEY",
+            ]),
+            "get_alert_rows(symbols)": (self.SHARD_ALERT_ROWS_QUERY, (), [
+                "SCAN q",
+                "SEARCH f USING COVERING INDEX idx_favorites_source_token",
+                "SEARCH s USING INTEGER PRIMARY KEY",
+                "SEARCH p USING INDEX sqlite_autoindex_prices_1",
+                "SEARCH r USING INDEX sqlite_autoindex_alert_rules_1",
+                "SEARCH b USING INTEGER PRIMARY KEY",
+            ]),
+        }
+        problems = []
+        for name, (query, params, expected) in queries.items():
+            self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            details = [row[-1] for row in self.cursor.fetchall()]
+            for step in expected:
+                if not any(detail.startswith(step) for detail in details):
+                    problems.append(f"{name}: expected '{step}', plan is {details}")
+            for detail in details:
+                unexpected_scan = detail.startswith("SCAN") and not any(detail.startswith(step) for step in expected)
+                if unexpected_scan or "TEMP B-TREE" in detail:
+                    problems.append(f"{name}: {detail}")
+        return problems
+
+class AsyncDatabase:
+    """
+    Asynchronous access layer over Database for use from the event loop.
+
+    Reads run on a small pool of reader connections (WAL lets them proceed while a write
+    is in progress). Writes go to a single writer connection and are grouped: every write
+    issued within `batch_window` seconds is applied in one transaction with one commit.
+    Each awaited write returns once its batch has been committed.
+    """
+
+    def __init__(self, db_path="favorites.db", readers=4, batch_window=0.01, max_batch=500,
+                 settings_cache_size=10000):
+        self.db_path = db_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+
+        self._writer = Database(db_path, autocommit=False)  # Also creates/migrates the schema
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()  # One reader connection per reader thread
+
+        self._pending = []  # (method name, args, future) waiting for the next batch
+        self._flush_handle = None
+
+        # Write-through LRU cache of per-user settings: (column, user_id) -> value
+        self._settings = OrderedDict()
+        self.settings_cache_size = settings_cache_size
+
+    def _cached_setting(self, key):
+        """Returns (True, value) if the setting is cached, (False, None) otherwise."""
+        if key in self._settings:
+            self._settings.move_to_end(key)
+            return True, self._settings[key]
+        return False, None
+
+    def _cache_setting(self, key, value, overwrite=True):
+        """Stores a setting; read results use overwrite=False so they never replace a newer write."""
+        if not overwrite and key in self._settings:
+            return
+        self._settings[key] = value
+        self._settings.move_to_end(key)
+        while len(self._settings) > self.settings_cache_size:
+            self._settings.popitem(last=False)
+
+    def _reader(self):
+        """Returns the reader connection of the current pool thread."""
+        reader = getattr(self._local, "db", None)
+        if reader is None:
+            reader = Database(self.db_path, setup=False)
+            self._local.db = reader
+        return reader
+
+    async def _read(self, method, *args):
+        """Runs a read method of Database on the reader pool."""
+        loop = asyncio.get_running_loop()
+        with db_query_seconds.time(method):  # Includes the wait for a free reader thread
+            return await loop.run_in_executor(self._read_executor, lambda: getattr(self._reader(), method)(*args))
+
+    async def _write(self, method, *args):
+        """Queues a write method of Database for the next batched transaction."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((method, args, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Sends the pending writes to the writer thread as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._write_executor, self._apply_batch, batch)
+        task.add_done_callback(lambda done: self._resolve(batch, done))
+
+    def _apply_batch(self, batch):
+        """Applies a batch of writes in one transaction (writer thread)."""
+        db_write_batch_size.observe(len(batch))
+        try:
+            with db_write_batch_seconds.time():
+                results = [getattr(self._writer, method)(*args) for method, args, _ in batch]
+                self._writer.conn.commit()
+            return results
+        except sqlite3.Error:
+            self._writer.conn.rollback()  # The batch is all-or-nothing
+            raise
+
+    @staticmethod
+    def _resolve(batch, done):
+        """Hands the batch outcome to every waiting caller."""
+        error = done.exception()
+        if error is not None:
+            logging.error(f"❌ Database write batch of {len(batch)} failed: {error}")
+        results = [None] * len(batch) if error else done.result()
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """Commits outstanding writes and stops the worker threads."""
+        futures = [future for _, _, future in self._pending]
+        self._flush()
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._writer.conn.close()
+
+    # --- Reads ---
+
+    async def get_last_source_message(self, user_id):
+        """Retrieves the `message_id` of the last message containing sources (cached)."""
+        key = ("last_message_id", user_id)
+        found, value = self._cached_setting(key)
+        if not found:
+            value = await self._read("get_last_source_message", user_id)
+            self._cache_setting(key, value, overwrite=False)
+        return value
+
+    async def get_watched_symbols(self):
+        """Retrieves (source, token, watchers) for every watched symbol."""
+        return await self._read("get_watched_symbols")
+
+    async def get_alert_rows(self):
+        """Retrieves (user_id, source, token, last_price, <alert rule>) for every active favorite."""
+        return await self._read("get_alert_rows")
+
+    async def get_user_watches(self, user_id, source):
+        """Retrieves (token, last_price) for every favorite of a user on 'source'."""
+        return await self._read("get_user_watches", user_id, source)
+
+    async def get_last_price(self, user_id, token, source):
+        """Retrieves the last stored price for a user's token from a specific source."""
+        return await self._read("get_last_price", user_id, token, source)
+
+    async def get_active_source(self, user_id):
+        """Retrieves the active data source for a user (defaults to Binance, cached)."""
+        key = ("active_source", user_id)
+        found, value = self._cached_setting(key)
+        if not found:
+            value = await self._read("get_active_source", user_id)
+            self._cache_setting(key, value, overwrite=False)
+        return value
+
+    async def get_digest(self, user_id):
+        """Returns True if the user receives alerts as a digest (cached)."""
+        key = ("digest", user_id)
+        found, value = self._cached_setting(key)
+        if not found:
+            value = await self._read("get_digest", user_id)
+            self._cache_setting(key, value, overwrite=False)
+        return value
+
+    async def get_favorites(self, user_id, source):
+        """Retrieves a list of favorite tokens for a user from a specific source."""
+        return await self._read("get_favorites", user_id, source)
+
+    async def get_blocked_users(self):
+        """Retrieves the ids of all blocked users."""
+        return await self._read("get_blocked_users")
+
+    async def get_alert_rules(self, user_id, source):
+        """Retrieves (token, threshold, direction, cooldown, last_alert_at) for every alert rule of a user on 'source'."""
+        return await self._read("get_alert_rules", user_id, source)
+
+    # --- Writes ---
+
+    async def update_last_source_message(self, user_id, message_id):
+        """Updates the last message ID containing sources for a user."""
+        await self._write("update_last_source_message", user_id, message_id)
+        self._cache_setting(("last_message_id", user_id), message_id)
+
+    async def update_last_price(self, user_id, token, price, source):
+        """Updates the last recorded price of a token for a user."""
+        return await self._write("update_last_price", user_id, token, price, source)
+
+    async def update_last_prices(self, rows):
+        """Upserts many baseline prices."""
+        return await self._write("update_last_prices", rows)
+
+    async def update_active_source(self, user_id, source):
+        """Updates the active data source for a user."""
+        await self._write("update_active_source", user_id, source)
+        self._cache_setting(("active_source", user_id), source)
+
+    async def update_digest(self, user_id, enabled):
+        """Turns digest mode on or off for a user."""
+        await self._write("update_digest", user_id, enabled)
+        self._cache_setting(("digest", user_id), bool(enabled))
+
+    async def add_favorite(self, user_id, token, source):
+        """Adds a token to the user's favorites list for a specific source."""
+        return await self._write("add_favorite", user_id, token, source)
+
+    async def remove_favorite(self, user_id, token, source):
+        """Removes a token from the user's favorites list."""
+        return await self._write("remove_favorite", user_id, token, source)
+
+    async def set_alert_rule(self, user_id, token, source, threshold, direction="both", cooldown=0):
+        """Creates or replaces the alert rule of a user's token."""
+        return await self._write("set_alert_rule", user_id, token, source, threshold, direction, cooldown)
+
+    async def delete_alert_rule(self, user_id, token, source):
+        """Removes the alert rule of a user's token."""
+        return await self._write("delete_alert_rule", user_id, token, source)
+
+    async def block_user(self, user_id, blocked_at, reason):
+        """Records a user that can no longer be messaged."""
+        return await self._write("block_user", user_id, blocked_at, reason)
+
+    async def unblock_user(self, user_id):
+        """Removes a user from the blocked list."""
+        return await self._write("unblock_user", user_id)
+
+    async def mark_alerted(self, rows):
+        """Stores the time of the last alert for rules with a cooldown."""
+        return await self._write("mark_alerted", rows)
+
 
 if __name__ == "__main__":
     db = Database()
-    print("Successfully initialized!")
\ No newline at end of file
+    print("Successfully initialized!")
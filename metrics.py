@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+
+# Default latency buckets (seconds), from cache hits to the 10 s request timeout
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()  # Also updated from the database threads
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket histogram (Prometheus layout), optionally split by labels."""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        """Observes the duration of the 'with' block."""
+        return _Timer(self, label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, series in sorted(self.series.items()):
+                cumulative = 0
+                labels = _format_labels(self.labels, label_values)
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    bucket = _format_labels(self.labels, label_values, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+                bucket = _format_labels(self.labels, label_values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-2]}")
+                lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+        return lines
+
+
+class _Timer:
+    """Context manager of Histogram.time (a plain class is cheaper than @contextmanager)."""
+
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+class Gauge:
+    """Value read from a callback when the metrics are scraped: {label values: value}."""
+
+    def __init__(self, name, description, collect, labels=()):
+        self.name = name
+        self.description = description
+        self.collect = collect
+        self.labels = labels
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            logging.error(f"❌ Could not collect metric {self.name}: {e}")
+            return lines
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+registry = []
+
+
+def register(metric):
+    """Adds a metric to the /metrics output and returns it."""
+    registry.append(metric)
+    return metric
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Hot path metrics ---
+
+price_lookup_seconds = register(Histogram(
+    "price_lookup_seconds", "Latency of price lookups (including the cache) by source", ("source",)))
+price_lookup_errors = register(Counter(
+    "price_lookup_errors_total", "Price lookups that returned an error by source and kind", ("source", "error")))
+upstream_request_seconds = register(Histogram(
+    "upstream_request_seconds", "Latency of HTTP requests to the price sources", ("source",)))
+db_query_seconds = register(Histogram(
+    "db_query_seconds", "Duration of database reads by method", ("method",)))
+db_write_batch_seconds = register(Histogram(
+    "db_write_batch_seconds", "Duration of batched write transactions"))
+db_write_batch_size = register(Histogram(
+    "db_write_batch_size", "Writes per batched transaction", buckets=(1, 5, 10, 50, 100, 500, 1000)))
+alert_cycle_seconds = register(Histogram(
+    "alert_cycle_seconds", "Duration of an alert scan cycle by scanner (bot or worker-N)", ("scanner",), buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)))
+alerts_triggered = register(Counter(
+    "alerts_triggered_total", "Alerts triggered"))
+alert_messages = register(Counter(
+    "alert_messages_total", "Alert messages queued (a digest counts once)"))
+handler_seconds = register(Histogram(
+    "handler_seconds", "Time to handle a Telegram update by update type", ("update",)))
+
+
+# --- Runtime log level ---
+
+def set_log_level(level):
+    """
+    Switches the root log level at runtime (e.g. DEBUG to see every price lookup).
+    Returns the new level name, or None if 'level' is not a logging level.
+    """
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        return None
+    logging.getLogger().setLevel(value)
+    logging.warning(f"⚠ Log level set to {logging.getLevelName(value)}")
+    return logging.getLevelName(value)
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+
+# Telegram allows about 30 messages per second overall and about one per second to the same chat
+GLOBAL_RATE = 25
+CHAT_RATE = 1
+
+
+class TokenBucket:
+    """
+    Token bucket limiter: 'rate' tokens per second, bursts of up to 'capacity'.
+    pause(seconds) blocks every acquirer, e.g. while Telegram asks us to retry later.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Takes a token if one is available (returns 0), otherwise returns the seconds to wait."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        while True:
+            wait = self.delay()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self):
+        """True if the bucket is full again, i.e. it can be dropped and recreated without changing behaviour."""
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class Notifier:
+    """
+    Outbound message queue served by a pool of worker tasks.
+
+    Messages wait in one queue per chat. Workers take the next chat that is ready, and a
+    chat whose bucket is empty is put back on a timer instead of holding a worker, so a
+    burst to one user never stalls the messages to everyone else. Every message also
+    passes a global token bucket, so bursts of alerts stay within Telegram's limits
+    instead of being rejected. TelegramRetryAfter pauses the limiter for the requested
+    time and the message is retried. Messages queued with the same (chat_id, key) are
+    merged: the newest text replaces the pending one and all callers share its result.
+    Chats that blocked the bot are reported to 'on_blocked' and skipped from then on.
+    """
+
+    def __init__(self, bot, on_blocked=None, workers=8, rate=GLOBAL_RATE, chat_rate=CHAT_RATE, max_retries=3):
+        self.bot = bot
+        self.on_blocked = on_blocked
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(rate)
+        self.chat_limiters = {}
+        self.chats = {}  # chat_id -> deque of (key, text, future, attempt) waiting to be sent
+        self.ready = asyncio.Queue()  # Chats with queued messages whose turn has come
+        self.pending = {}  # (chat_id, key) -> [text, future]
+        self.blocked = set()
+        self.tasks = []
+
+        # Counters for monitoring
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.merged = 0
+
+    def start(self):
+        """Starts the worker tasks."""
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        """Cancels the worker tasks; queued messages are dropped."""
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def send(self, chat_id, text, key=None):
+        """
+        Queues a message.
+
+        Returns:
+            asyncio.Future: Resolves to True once the message is delivered, False if it
+            could not be delivered.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if chat_id in self.blocked:
+            future.set_result(False)
+            return future
+
+        if key is not None:
+            entry = self.pending.get((chat_id, key))
+            if entry is not None:
+                entry[0] = text  # Not sent yet: deliver the newest version once
+                self.merged += 1
+                return entry[1]
+            self.pending[(chat_id, key)] = [text, future]
+
+        messages = self.chats.get(chat_id)
+        if messages is None:
+            # A chat with queued messages is always in exactly one place: the ready queue,
+            # a retry timer or a worker, so it is scheduled here only when it has none yet
+            messages = self.chats[chat_id] = deque()
+            self.ready.put_nowait(chat_id)
+        messages.append((key, text, future, 0))
+        return future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await self.ready.get()
+            wait = 0 if chat_id in self.blocked else self._chat_limiter(chat_id).delay()
+            if wait:
+                loop.call_later(wait, self.ready.put_nowait, chat_id)  # Serve other chats meanwhile
+                continue
+
+            messages = self.chats[chat_id]
+            key, text, future, attempt = messages.popleft()
+            try:
+                if key is not None and attempt == 0:
+                    text = self.pending.pop((chat_id, key))[0]
+                delivered = await self._deliver(chat_id, text, attempt)
+            except Exception as e:
+                logging.error(f"❌ Unexpected error while sending a message to {chat_id}: {e}")
+                delivered = False
+
+            if delivered is None:
+                messages.appendleft((key, text, future, attempt + 1))  # Retried first once the pause is over
+            elif not future.done():
+                future.set_result(delivered)
+
+            if messages:
+                self.ready.put_nowait(chat_id)
+            else:
+                del self.chats[chat_id]
+
+    async def _deliver(self, chat_id, text, attempt=0):
+        """
+        Sends one message within the global rate limit (the caller holds a chat token).
+        Returns True on success, False if it failed and None if it should be retried.
+        """
+        if chat_id in self.blocked:
+            return False
+        await self.limiter.acquire()
+        try:
+            await self.bot.send_message(chat_id, text)
+            self.sent += 1
+            return True
+        except TelegramRetryAfter as e:
+            # Flood control applies to the whole bot, hold every worker back
+            self.retried += 1
+            self.limiter.pause(e.retry_after)
+            logging.warning(f"⚠ Telegram flood control: pausing notifications for {e.retry_after}s")
+            if attempt < self.max_retries:
+                return None
+        except TelegramForbiddenError:
+            logging.warning(f"❌ Could not send a message to user {chat_id}, possibly blocked the bot.")
+            self.blocked.add(chat_id)
+            if self.on_blocked is not None:
+                await self.on_blocked(chat_id)
+            return False
+        except TelegramAPIError as e:
+            logging.error(f"❌ Failed to send a message to {chat_id}: {e}")
+
+        self.failed += 1
+        return False
+
+    def _chat_limiter(self, chat_id):
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            if len(self.chat_limiters) > 10000:
+                # Forget chats that have been quiet long enough for their bucket to refill
+                self.chat_limiters = {chat: bucket for chat, bucket in self.chat_limiters.items() if not bucket.is_idle()}
+            limiter = self.chat_limiters[chat_id] = TokenBucket(self.chat_rate, capacity=3)
+        return limiter
+
+    def unblock(self, chat_id):
+        """Allows messages to a chat again (the user talked to the bot)."""
+        self.blocked.discard(chat_id)
+
+    def stats(self):
+        return {
+            "queued": sum(len(messages) for messages in self.chats.values()),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "merged": self.merged,
+            "blocked": len(self.blocked),
+        }
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class PriceCache:
+    """
+    Process-wide price cache keyed by (source, symbol).
+
+    Entries expire after `ttl` seconds and the least recently used entry is evicted
+    once `maxsize` is reached. Concurrent misses for the same key share a single
+    upstream fetch (single-flight), so a burst of users asking for the same token
+    results in one exchange request.
+    """
+
+    def __init__(self, ttl=15, maxsize=5000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Task of the running fetch
+
+        # Counters used to size the TTL against exchange rate limits
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        """Returns the cached value for 'key', or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)  # Mark as recently used
+        return value
+
+    def set(self, key, value):
+        """Stores 'value' under 'key' and evicts the oldest entries above maxsize."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch):
+        """
+        Returns the cached value for 'key' or awaits 'fetch()' to obtain it.
+        Error strings are not cached, so the next caller retries the source.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            # Another coroutine is already fetching this key, wait for its result
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        task = asyncio.ensure_future(fetch())
+        self._inflight[key] = task
+
+        def _on_done(done):
+            self._inflight.pop(key, None)
+            if not done.cancelled() and done.exception() is None:
+                result = done.result()
+                if result is not None and not isinstance(result, str):
+                    self.set(key, result)
+
+        task.add_done_callback(_on_done)
+
+        # Shield the shared fetch so a cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def clear(self):
+        """Drops all cached entries (in-flight fetches are left running)."""
+        self._entries.clear()
+
+    def stats(self):
+        """Returns the cache counters and current size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+        }
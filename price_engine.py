@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import os
+import time
+import aiohttp
+from dotenv import load_dotenv
+from coingecko_index import resolve_coingecko_id
+from price_cache import PriceCache
+from circuit_breaker import CircuitBreaker
+from quote_batcher import QuoteBatcher
+from metrics import upstream_request_seconds
+
+load_dotenv()
+
+# Return values shared with the handlers in bot.py
+PAIR_NOT_FOUND = "Pair does not exist"
+PRICE_ERROR = "Error retrieving price"
+
+# Timeout for a single price request (seconds)
+REQUEST_TIMEOUT = 10
+
+# Maximum number of simultaneous connections kept in the shared pool
+POOL_SIZE = int(os.getenv("PRICE_POOL_SIZE", 100))
+
+# Endpoints returning every spot ticker of an exchange in one response (overridable, e.g. to point at a local stub)
+BULK_TICKER_URLS = {
+    "Binance": os.getenv("BINANCE_TICKERS_URL", "https://api.binance.com/api/v3/ticker/price"),
+    "ByBit": os.getenv("BYBIT_TICKERS_URL", "https://api.bybit.com/v5/market/tickers?category=spot"),
+    "OKX": os.getenv("OKX_TICKERS_URL", "https://www.okx.com/api/v5/market/tickers?instType=SPOT"),
+}
+
+# Batching of CoinGecko / CoinMarketCap quotes: collection window (seconds) and ids per request
+BATCH_WINDOW = float(os.getenv("PRICE_BATCH_WINDOW", 0.05))
+COINGECKO_MAX_IDS = 250
+CMC_MAX_SYMBOLS = 100
+
+# Sources tried in this order when the user's source cannot deliver a quote (e.g. "Binance,OKX,ByBit", empty disables)
+PRICE_FALLBACK_CHAIN = [source for source in os.getenv("PRICE_FALLBACK_CHAIN", "").split(",") if source]
+
+# One circuit breaker per price source: consecutive failures before failing fast, seconds until the next probe
+breakers = {
+    source: CircuitBreaker(
+        source,
+        failure_threshold=int(os.getenv("BREAKER_FAILURES", 5)),
+        reset_timeout=float(os.getenv("BREAKER_RESET", 30)),
+    )
+    for source in ("Binance", "CoinGecko", "CoinMarketCap", "ByBit", "OKX")
+}
+
+
+class SourceUnavailable(aiohttp.ClientError):
+    """Raised instead of sending a request while the source's circuit breaker is open."""
+
+
+# Shared aiohttp session, created lazily on the running event loop
+_session = None
+
+# Process-wide cache of recent quotes keyed by (source, symbol)
+price_cache = PriceCache(
+    ttl=float(os.getenv("PRICE_CACHE_TTL", 15)),
+    maxsize=int(os.getenv("PRICE_CACHE_SIZE", 5000)),
+)
+
+# Seconds a streamed price answers lookups of its symbol without a request
+STREAM_PRICE_TTL = float(os.getenv("STREAM_PRICE_TTL", 5))
+
+# Last streamed price per (source, SYMBOL) as (price, time.monotonic() of the tick), written by the price streams
+stream_prices = {}
+
+
+def get_session():
+    """
+    Returns the process-wide aiohttp session, creating it on first use.
+    All price requests go through this single pooled session, so TCP and TLS
+    connections to the exchanges are reused instead of being opened per call.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_SIZE, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+    return _session
+
+
+async def close_session():
+    """Closes the shared session (called on bot shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch_json(url, headers=None, source=None):
+    """
+    Performs a GET request on the shared session and returns the decoded JSON body.
+    Raises aiohttp.ClientError / asyncio.TimeoutError on network problems.
+
+    With 'source' the request goes through that source's circuit breaker: while it is
+    open SourceUnavailable is raised right away. Timeouts, connection errors, 5xx and 429
+    count as failures; other 4xx (e.g. an unknown symbol) mean the source is healthy.
+    """
+    breaker = breakers.get(source)
+    if breaker is not None and not breaker.allow():
+        raise SourceUnavailable(f"{source} is unavailable (circuit open)")
+
+    session = get_session()
+    try:
+        with upstream_request_seconds.time(source or "other"):
+            async with session.get(url, headers=headers or {}) as response:
+                response.raise_for_status()  # Raise an error for non-200 responses
+                data = await response.json(content_type=None)
+    except aiohttp.ClientResponseError as e:
+        if breaker is not None:
+            if e.status >= 500 or e.status == 429:
+                breaker.record_failure(e)
+            else:
+                breaker.record_success()
+        raise
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        if breaker is not None:
+            breaker.record_failure(e)
+        raise
+
+    if breaker is not None:
+        breaker.record_success()
+    return data
+
+
+async def fetch_coingecko_prices(symbols):
+    """
+    Fetches USD prices for several symbols with one CoinGecko simple/price request.
+    Symbols are translated to CoinGecko ids through the persisted symbol -> id index.
+
+    Returns:
+        dict: {SYMBOL: price} for the symbols found in the response.
+    """
+    coin_ids = {symbol: resolve_coingecko_id(symbol) for symbol in symbols}
+    ids = ",".join(sorted(set(coin_ids.values())))
+    data = await fetch_json(f"https://api.coingecko.com/api/v3/simple/price?ids={ids}&vs_currencies=usd", source="CoinGecko")
+
+    prices = {}
+    for symbol, coin_id in coin_ids.items():
+        quote = data.get(coin_id, {})
+        if "usd" in quote:
+            prices[symbol] = float(quote["usd"])
+        else:
+            logging.warning(f"⚠ CoinGecko: '{coin_id}' not found in the response.")
+    logging.info(f"✅ CoinGecko: {len(prices)}/{len(symbols)} prices in one request")
+    return prices
+
+
+async def fetch_cmc_prices(symbols):
+    """
+    Fetches USD prices for several symbols with one CoinMarketCap quotes/latest request.
+
+    Returns:
+        dict: {SYMBOL: price} for the symbols found in the response.
+    """
+    headers = {"X-CMC_PRO_API_KEY": os.getenv("CMC_API_KEY")}  # CoinMarketCap requires an API key
+    joined = ",".join(symbols)
+    data = await fetch_json(
+        f"https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest?symbol={joined}&convert=USD",
+        headers,
+        source="CoinMarketCap",
+    )
+
+    prices = {}
+    for symbol in symbols:
+        price = data["data"].get(symbol, {}).get("quote", {}).get("USD", {}).get("price")
+        if price is not None:
+            prices[symbol] = float(price)
+    logging.info(f"✅ CoinMarketCap: {len(prices)}/{len(symbols)} prices in one request")
+    return prices
+
+
+# Batchers merging concurrent lookups for sources with multi-symbol quote endpoints
+quote_batchers = {
+    "CoinGecko": QuoteBatcher(
+        fetch_coingecko_prices, max_batch=COINGECKO_MAX_IDS, window=BATCH_WINDOW,
+        missing=PRICE_ERROR, error=PRICE_ERROR, quiet_errors=(SourceUnavailable,),
+    ),
+    "CoinMarketCap": QuoteBatcher(
+        fetch_cmc_prices, max_batch=CMC_MAX_SYMBOLS, window=BATCH_WINDOW,
+        missing=PRICE_ERROR, error=PRICE_ERROR, quiet_errors=(SourceUnavailable,),
+    ),
+}
+
+
+async def fetch_price(source, symbol):
+    """
+    Retrieves the USD price of 'symbol' from 'source' without blocking the event loop.
+    CoinGecko and CoinMarketCap requests are merged into multi-symbol batches.
+
+    Returns:
+        float | str: The price, or PAIR_NOT_FOUND / PRICE_ERROR.
+    """
+    if source in quote_batchers:
+        return await quote_batchers[source].get(symbol.upper())
+
+    # Define API endpoints for different price sources
+    sources = {
+        "Binance": f"https://api.binance.com/api/v3/ticker/price?symbol={symbol.upper()}USDT",
+        "ByBit": f"https://api.bybit.com/v5/market/tickers?category=spot&symbol={symbol.upper()}USDT",
+        "OKX": f"https://www.okx.com/api/v5/market/ticker?instId={symbol.upper()}-USDT"
+    }
+
+    if source not in sources:
+        logging.warning(f"⚠ Unknown price source '{source}'")
+        return PRICE_ERROR
+
+    # Log the request URL
+    request_url = sources[source]
+    logging.debug("📡 Requesting data from %s: %s", source, request_url)
+
+    try:
+        data = await fetch_json(request_url, source=source)
+
+        logging.debug("📥 Response from %s: %s", source, data)  # Lazy: only formatted at DEBUG
+
+        # Process data based on the selected price source
+        if source == "Binance":
+            price = float(data.get("price", 0))
+            logging.debug("✅ Binance: %s price = %s", symbol, price)
+            return price
+
+        elif source == "ByBit":
+            if data["retCode"] != 0:
+                logging.error(f"❌ ByBit API error: {data}")
+                return PRICE_ERROR
+
+            # The symbol filter returns at most one ticker
+            tickers = data["result"]["list"]
+            if not tickers:
+                return PAIR_NOT_FOUND
+
+            price = float(tickers[0]["lastPrice"])
+            logging.debug("✅ ByBit: %s price = %s", symbol, price)
+            return price
+
+        elif source == "OKX":
+            if "data" in data and isinstance(data["data"], list) and len(data["data"]) > 0:
+                price = float(data["data"][0].get("last", 0))
+                logging.debug("✅ OKX: %s price = %s", symbol, price)
+                return price
+
+    except SourceUnavailable as e:
+        logging.debug("⚠ %s", e)  # Every lookup while the circuit is open, the breaker logs the outage once
+        return PRICE_ERROR
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"❌ Request error from {source} for {symbol}: {e}")
+    except (KeyError, ValueError, TypeError) as e:
+        logging.error(f"❌ Invalid response from {source} for {symbol}: {e}")
+
+    # Return an error message if price retrieval fails
+    logging.warning(f"⚠ Returning '{PRICE_ERROR}' for {symbol} from {source}")
+    return PRICE_ERROR
+
+
+async def get_cached_price(source, symbol):
+    """
+    Returns the price of 'symbol' on 'source' from its ticker stream or the shared cache.
+    On a miss a single upstream request is made, no matter how many callers wait for it.
+    """
+    symbol = symbol.upper()
+
+    # Symbols on a live ticker stream are answered with their latest tick
+    streamed = stream_prices.get((source, symbol))
+    if streamed is not None and time.monotonic() - streamed[1] <= STREAM_PRICE_TTL:
+        return streamed[0]
+
+    # Reuse a fresh full ticker table if the scanner has already downloaded one
+    tickers = price_cache.get((source, "*"))
+    if tickers is not None and symbol in tickers:
+        return tickers[symbol]
+
+    return await price_cache.get_or_fetch((source, symbol), lambda: fetch_price(source, symbol))
+
+
+async def get_cached_prices(source, symbols):
+    """
+    Looks up several symbols of one source concurrently.
+    For CoinGecko and CoinMarketCap the lookups land in the same batching window and
+    are sent as chunked multi-symbol requests.
+
+    Returns:
+        dict: {SYMBOL: price or error string}
+    """
+    symbols = [symbol.upper() for symbol in symbols]
+    prices = await asyncio.gather(*(get_cached_price(source, symbol) for symbol in symbols))
+    return dict(zip(symbols, prices))
+
+
+def parse_tickers(source, data):
+    """
+    Converts a full ticker response of a bulk source into a {SYMBOL: price} table.
+    Only USDT-quoted spot pairs are kept, matching the single-symbol lookups.
+    """
+    tickers = {}
+
+    if source == "Binance":
+        for item in data:
+            if item["symbol"].endswith("USDT"):
+                tickers[item["symbol"][:-4]] = float(item["price"])
+
+    elif source == "ByBit":
+        for item in data.get("result", {}).get("list", []):
+            if item["symbol"].endswith("USDT"):
+                tickers[item["symbol"][:-4]] = float(item["lastPrice"])
+
+    elif source == "OKX":
+        for item in data.get("data", []):
+            if item["instId"].endswith("-USDT"):
+                tickers[item["instId"][:-5]] = float(item["last"])
+
+    return tickers
+
+
+async def fetch_all_tickers(source):
+    """
+    Downloads the complete spot ticker table of a bulk source in a single request.
+
+    Returns:
+        dict | str: {SYMBOL: price}, or PRICE_ERROR if the request failed.
+    """
+    try:
+        data = await fetch_json(BULK_TICKER_URLS[source], source=source)
+        tickers = parse_tickers(source, data)
+        logging.debug(f"📥 Loaded {len(tickers)} tickers from {source}")
+        return tickers
+    except SourceUnavailable as e:
+        logging.debug("⚠ %s", e)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"❌ Request error while fetching tickers from {source}: {e}")
+    except (KeyError, ValueError, TypeError) as e:
+        logging.error(f"❌ Invalid ticker response from {source}: {e}")
+    return PRICE_ERROR
+
+
+async def get_ticker_snapshot(source):
+    """
+    Returns the cached full ticker table of a bulk source.
+    The table is stored in the shared price cache under (source, "*"), so every scan
+    cycle costs at most one request per exchange.
+    """
+    return await price_cache.get_or_fetch((source, "*"), lambda: fetch_all_tickers(source))
+
+
+def fallback_sources(source):
+    """Sources to try after 'source' failed: the rest of the fallback chain, without open breakers."""
+    if source not in PRICE_FALLBACK_CHAIN:
+        return []
+    return [alt for alt in PRICE_FALLBACK_CHAIN if alt != source and not breakers[alt].is_open()]
+
+
+def breaker_report():
+    """Returns the circuit breaker state of every source."""
+    return {source: breaker.stats() for source, breaker in breakers.items()}
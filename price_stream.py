@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import aiohttp
+from price_engine import get_session, stream_prices
+
+# Public spot ticker WebSocket endpoints (overridable, e.g. to point at a local replay server)
+STREAM_URLS = {
+    "Binance": os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443/ws"),
+    "ByBit": os.getenv("BYBIT_WS_URL", "wss://stream.bybit.com/v5/public/spot"),
+    "OKX": os.getenv("OKX_WS_URL", "wss://ws.okx.com:8443/ws/v5/public"),
+}
+
+# Symbols per subscribe request accepted by each exchange
+SUBSCRIBE_CHUNK = {"Binance": 200, "ByBit": 10, "OKX": 100}
+
+# Application-level keepalive (seconds); ByBit and OKX drop idle connections after ~30 s
+PING_INTERVAL = 20
+
+
+def subscribe_messages(source, symbols, subscribe=True):
+    """Builds the (un)subscribe requests of 'source' for the given symbols."""
+    symbols = sorted(symbols)
+    chunk = SUBSCRIBE_CHUNK[source]
+    messages = []
+
+    for i in range(0, len(symbols), chunk):
+        part = symbols[i:i + chunk]
+        if source == "Binance":
+            messages.append({
+                "method": "SUBSCRIBE" if subscribe else "UNSUBSCRIBE",
+                "params": [f"{symbol.lower()}usdt@miniTicker" for symbol in part],
+                "id": random.randint(1, 2 ** 31),
+            })
+        elif source == "ByBit":
+            messages.append({
+                "op": "subscribe" if subscribe else "unsubscribe",
+                "args": [f"tickers.{symbol}USDT" for symbol in part],
+            })
+        elif source == "OKX":
+            messages.append({
+                "op": "subscribe" if subscribe else "unsubscribe",
+                "args": [{"channel": "tickers", "instId": f"{symbol}-USDT"} for symbol in part],
+            })
+
+    return messages
+
+
+def parse_ticks(source, message):
+    """
+    Extracts (SYMBOL, price) pairs from a ticker frame of 'source'.
+    Subscription acknowledgements and pongs yield nothing.
+    """
+    ticks = []
+
+    if source == "Binance":
+        if message.get("e") == "24hrMiniTicker" and message["s"].endswith("USDT"):
+            ticks.append((message["s"][:-4], float(message["c"])))
+
+    elif source == "ByBit":
+        if str(message.get("topic", "")).startswith("tickers."):
+            data = message["data"]
+            if data["symbol"].endswith("USDT"):
+                ticks.append((data["symbol"][:-4], float(data["lastPrice"])))
+
+    elif source == "OKX":
+        if message.get("arg", {}).get("channel") == "tickers":
+            for item in message.get("data", []):
+                if item["instId"].endswith("-USDT"):
+                    ticks.append((item["instId"][:-5], float(item["last"])))
+
+    return ticks
+
+
+def ping_message(source):
+    """Returns the application-level ping of 'source' (Binance relies on WebSocket pings)."""
+    if source == "ByBit":
+        return json.dumps({"op": "ping"})
+    if source == "OKX":
+        return "ping"
+    return None
+
+
+class PriceStream:
+    """
+    Keeps a live ticker subscription to one exchange for a set of symbols.
+
+    Every tick updates price_engine's `stream_prices`, which price lookups are served from,
+    and is passed to `on_tick(source, symbol, price)`.
+    The connection is re-established with exponential backoff when it drops, and the
+    current symbol set is subscribed again.
+    """
+
+    def __init__(self, source, on_tick, url=None, max_backoff=60):
+        self.source = source
+        self.on_tick = on_tick
+        self.url = url or STREAM_URLS[source]
+        self.max_backoff = max_backoff
+        self.symbols = set()
+        self.ws = None
+        self.task = None
+
+        # Counters for monitoring
+        self.ticks = 0
+        self.reconnects = 0
+
+    def stats(self):
+        """Returns the stream counters and the number of subscribed symbols."""
+        return {"ticks": self.ticks, "reconnects": self.reconnects, "symbols": len(self.symbols)}
+
+    def start(self):
+        """Starts the connection loop in the background."""
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """Stops the connection loop."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def set_symbols(self, symbols):
+        """Updates the subscription to exactly 'symbols' (only the difference is sent)."""
+        symbols = {symbol.upper() for symbol in symbols}
+        added, removed = symbols - self.symbols, self.symbols - symbols
+        self.symbols = symbols
+
+        if self.ws is None or self.ws.closed:
+            return  # Subscribed on the next (re)connect
+
+        for message in subscribe_messages(self.source, removed, subscribe=False):
+            await self.ws.send_json(message)
+        for message in subscribe_messages(self.source, added):
+            await self.ws.send_json(message)
+        for symbol in removed:
+            stream_prices.pop((self.source, symbol), None)
+
+    async def run(self):
+        """Connection loop with automatic reconnect and resubscribe."""
+        backoff = 1
+        while True:
+            try:
+                await self._connect()
+                backoff = 1  # The connection was healthy, reconnect right away
+            except asyncio.CancelledError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"⚠ {self.source} stream error: {e}")
+
+            self.reconnects += 1
+            logging.info(f"🔄 Reconnecting to the {self.source} stream in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _connect(self):
+        """Connects, subscribes to the current symbols and processes frames until the connection ends."""
+        async with get_session().ws_connect(self.url, heartbeat=PING_INTERVAL, timeout=10) as ws:
+            self.ws = ws
+            logging.info(f"✅ Connected to the {self.source} stream ({len(self.symbols)} symbols)")
+            try:
+                for message in subscribe_messages(self.source, self.symbols):
+                    await ws.send_json(message)
+
+                loop = asyncio.get_running_loop()
+                ping = ping_message(self.source)
+                next_ping = loop.time() + PING_INTERVAL
+                while True:
+                    try:
+                        msg = await ws.receive(timeout=max(0.01, next_ping - loop.time()))
+                    except asyncio.TimeoutError:
+                        msg = None
+
+                    # Keepalive on a fixed schedule, busy streams need it as much as idle ones
+                    if loop.time() >= next_ping:
+                        if ping is not None:
+                            await ws.send_str(ping)
+                        next_ping = loop.time() + PING_INTERVAL
+                    if msg is None:
+                        continue
+
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            return
+                        continue
+                    if msg.data == "pong":
+                        continue
+
+                    for symbol, price in parse_ticks(self.source, json.loads(msg.data)):
+                        self.ticks += 1
+                        stream_prices[(self.source, symbol)] = (price, time.monotonic())
+                        await self.on_tick(self.source, symbol, price)
+            finally:
+                self.ws = None
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+
+class QuoteBatcher:
+    """
+    Collects single-symbol quote requests for a short window and sends them upstream
+    as chunked multi-symbol requests.
+
+    `fetch_many(symbols)` must return a {SYMBOL: price} dict. Symbols missing from the
+    dict receive `missing`; if the request fails every caller of the chunk receives `error`.
+    Failures of the `quiet_errors` types (expected ones, e.g. an open circuit) are only logged at debug level.
+    """
+
+    def __init__(self, fetch_many, max_batch, window=0.05, missing=None, error=None, quiet_errors=()):
+        self.fetch_many = fetch_many
+        self.max_batch = max_batch
+        self.window = window
+        self.missing = missing
+        self.error = error
+        self.quiet_errors = quiet_errors
+        self._pending = {}  # symbol -> asyncio.Future shared by all callers of that symbol
+        self._flush_handle = None
+        self._tasks = set()  # Requests in flight, referenced so they are not garbage collected
+
+        # Counters to compare upstream requests with the number of symbols served
+        self.requests = 0
+        self.symbols = 0
+
+    async def get(self, symbol):
+        """Queues 'symbol' for the next batch and waits for its price."""
+        future = self._pending.get(symbol)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[symbol] = future
+
+            if len(self._pending) >= self.max_batch:
+                self._flush()  # A full chunk is ready, no need to wait for the window
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        """Splits the pending symbols into chunks of max_batch and starts one request per chunk."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, {}
+        symbols = list(pending)
+        for i in range(0, len(symbols), self.max_batch):
+            chunk = {symbol: pending[symbol] for symbol in symbols[i:i + self.max_batch]}
+            task = asyncio.ensure_future(self._send(chunk))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, chunk):
+        """Fetches one chunk and resolves the futures of its callers."""
+        self.requests += 1
+        self.symbols += len(chunk)
+
+        try:
+            result = await self.fetch_many(list(chunk))
+        except self.quiet_errors as e:
+            logging.debug("⚠ Batched quote request skipped: %s", e)
+            result = self.error
+        except Exception as e:
+            logging.error(f"❌ Batched quote request failed: {e}")
+            result = self.error
+
+        for symbol, future in chunk.items():
+            if future.done():
+                continue
+            if isinstance(result, dict):
+                future.set_result(result.get(symbol, self.missing))
+            else:
+                future.set_result(self.error)
+
+    def stats(self):
+        """Returns the number of upstream requests and symbols served through them."""
+        return {"requests": self.requests, "symbols": self.symbols}
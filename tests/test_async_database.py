@@ -0,0 +1,84 @@
+"""AsyncDatabase: the write-through settings cache and flushing queued writes on close."""
+import asyncio
+from databse import AsyncDatabase, Database
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_settings_are_served_from_the_cache(tmp_path):
+    path = str(tmp_path / "favorites.db")
+
+    async def scenario():
+        db = AsyncDatabase(path)
+        assert await db.get_active_source(1) == "Binance"
+        # Changed behind the cache's back: the cached value is still served
+        other = Database(path, setup=False)
+        other.update_active_source(1, "OKX")
+        other.conn.close()
+        source = await db.get_active_source(1)
+        await db.close()
+        return source
+
+    assert run(scenario()) == "Binance"
+
+
+def test_set_calls_update_the_cached_settings(tmp_path):
+    path = str(tmp_path / "favorites.db")
+
+    async def scenario():
+        db = AsyncDatabase(path)
+        before = (await db.get_active_source(1), await db.get_digest(1), await db.get_last_source_message(1))
+        await db.update_active_source(1, "ByBit")
+        await db.update_digest(1, 1)
+        await db.update_last_source_message(1, 42)
+        after = (await db.get_active_source(1), await db.get_digest(1), await db.get_last_source_message(1))
+        await db.close()
+        return before, after
+
+    before, after = run(scenario())
+    assert before == ("Binance", False, None)
+    assert after == ("ByBit", True, 42)
+
+    stored = Database(path, setup=False)
+    assert (stored.get_active_source(1), stored.get_digest(1), stored.get_last_source_message(1)) == after
+    stored.conn.close()
+
+
+def test_read_finishing_after_a_write_keeps_the_written_value(tmp_path):
+    path = str(tmp_path / "favorites.db")
+
+    async def scenario():
+        db = AsyncDatabase(path)
+        # The read may return the old row after the write was cached; it must not replace it
+        await asyncio.gather(db.get_active_source(1), db.update_active_source(1, "OKX"))
+        source = await db.get_active_source(1)
+        await db.close()
+        return source
+
+    assert run(scenario()) == "OKX"
+
+
+def test_close_commits_queued_writes(tmp_path):
+    path = str(tmp_path / "favorites.db")
+
+    async def scenario():
+        # A window far longer than the test: only close() can flush the batch
+        db = AsyncDatabase(path, batch_window=60)
+        writes = [
+            asyncio.ensure_future(db.add_favorite(1, token, "Binance")) for token in ("BTC", "ETH", "SOL")
+        ] + [asyncio.ensure_future(db.update_active_source(1, "OKX"))]
+        await asyncio.sleep(0)  # Queued, not committed
+        reader = Database(path, setup=False)
+        assert reader.get_favorites(1, "Binance") == []
+        reader.conn.close()
+        await db.close()
+        return all(write.done() and write.exception() is None for write in writes)
+
+    assert run(scenario())
+
+    stored = Database(path, setup=False)
+    assert sorted(stored.get_favorites(1, "Binance")) == ["BTC", "ETH", "SOL"]
+    assert stored.get_active_source(1) == "OKX"
+    stored.conn.close()
@@ -0,0 +1,36 @@
+"""Query plan regression tests: every scanner query must keep searching its index."""
+import pytest
+from databse import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "favorites.db"))
+    yield db
+    db.conn.close()
+
+
+def test_scanner_queries_use_their_indexes(db):
+    assert db.check_query_plans() == []
+
+
+def test_dropped_favorites_index_is_reported(db):
+    db.cursor.execute("DROP INDEX idx_favorites_source_token")
+    db.conn.commit()
+
+    problems = db.check_query_plans()
+    assert any(problem.startswith("get_watched_symbols:") for problem in problems)
+    assert any(problem.startswith("get_alert_rows(symbols):") for problem in problems)
+
+
+def test_unsharded_alert_rows_without_the_prices_key_is_reported(db):
+    # The same table without its primary key (and so without sqlite_autoindex_prices_1)
+    db.cursor.executescript("""
+        CREATE TABLE prices_plain (user_id INTEGER, source TEXT, token TEXT, price REAL);
+        DROP TABLE prices;
+        ALTER TABLE prices_plain RENAME TO prices;
+    """)
+
+    problems = db.check_query_plans()
+    assert any(problem.startswith("get_alert_rows: expected 'SEARCH p") for problem in problems)
+    assert any(problem.startswith("get_last_price:") for problem in problems)
@@ -0,0 +1,222 @@
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+import numpy as np
+
+# Raw samples (one per scan cycle) are kept in one block per symbol and day for RAW_RETENTION seconds,
+# then averaged into hourly samples (blocks of 30 days) that are kept for HOURLY_RETENTION seconds
+RAW = 0
+HOURLY = 3600
+BLOCK_SPANS = {RAW: 86400, HOURLY: 30 * 86400}
+RAW_RETENTION = 7 * 86400
+HOURLY_RETENTION = 365 * 86400
+
+# Seconds between two compaction passes
+COMPACT_INTERVAL = 3600
+
+
+def encode_block(offsets, prices):
+    """
+    Packs a block of samples: second offsets from the block start, delta-encoded as uint32
+    (a steady poll interval compresses to almost nothing), and float32 prices, zlib-compressed.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    deltas = np.diff(offsets, prepend=0).astype(np.uint32)
+    payload = deltas.tobytes() + np.asarray(prices, dtype=np.float32).tobytes()
+    return zlib.compress(payload, 6)
+
+
+def decode_block(start, count, data):
+    """Unpacks a block into (timestamps, prices) float64 arrays."""
+    payload = zlib.decompress(data)
+    deltas = np.frombuffer(payload, dtype=np.uint32, count=count)
+    prices = np.frombuffer(payload, dtype=np.float32, count=count, offset=4 * count)
+    return start + np.cumsum(deltas, dtype=np.float64), prices.astype(np.float64)
+
+
+class TimeSeriesStore:
+    """
+    Price history per (source, symbol), shared by all users, in the 'price_history' table.
+
+    Samples are appended to the symbol's block of the current day, which is kept in memory
+    and rewritten by flush() (one row per symbol and cycle). Range queries decode only the
+    blocks overlapping the range.
+    """
+
+    def __init__(self, db_path="favorites.db"):
+        self.db_path = db_path
+        self.conn = self._connect()  # Writer connection (flush / compact)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS price_history (
+                source TEXT,
+                token TEXT,
+                resolution INTEGER,
+                start INTEGER,
+                count INTEGER,
+                data BLOB,
+                PRIMARY KEY (source, token, resolution, start)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+        self.write_lock = threading.Lock()
+        self.local = threading.local()  # One reader connection per thread
+        self.lock = threading.Lock()  # Appends happen on the event loop, flushes in a worker thread
+        self.open_blocks = {}  # (source, TOKEN) -> [start, offsets array('l'), prices array('f')]
+        self.dirty = set()
+        self.last_compact = 0.0
+
+        # Counters for monitoring
+        self.samples = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    def _load_block(self, source, token, resolution, start, conn=None):
+        row = (conn or self._reader()).execute(
+            "SELECT count, data FROM price_history WHERE source = ? AND token = ? AND resolution = ? AND start = ?",
+            (source, token, resolution, start),
+        ).fetchone()
+        if row is None:
+            return array("l"), array("f")
+        times, prices = decode_block(start, *row)
+        return array("l", (times - start).astype(np.int64).tolist()), array("f", prices.tolist())
+
+    def append(self, source, token, timestamp, price):
+        """Adds one sample to the open raw block of (source, token)."""
+        key = (source, token.upper())
+        start = int(timestamp) // BLOCK_SPANS[RAW] * BLOCK_SPANS[RAW]
+        with self.lock:
+            block = self.open_blocks.get(key)
+            if block is None or block[0] != start:
+                # New day, or first sample since a restart: continue what is already stored
+                block = self.open_blocks[key] = [start, *self._load_block(*key, RAW, start)]
+            offset = int(timestamp) - start
+            if block[1] and offset <= block[1][-1]:
+                return  # Samples are strictly increasing in time
+            block[1].append(offset)
+            block[2].append(price)
+            self.dirty.add(key)
+            self.samples += 1
+
+    def append_prices(self, source, prices, timestamp):
+        """Adds one sample per symbol of a {SYMBOL: price} table (error strings are skipped)."""
+        for token, price in prices.items():
+            if isinstance(price, (int, float)) and price > 0:
+                self.append(source, token, timestamp, price)
+
+    def flush(self):
+        """Writes the open blocks that received samples since the last flush (one transaction)."""
+        with self.lock:
+            rows = [
+                (source, token, RAW, block[0], len(block[1]), encode_block(block[1], block[2]))
+                for (source, token), block in ((key, self.open_blocks[key]) for key in self.dirty)
+            ]
+            self.dirty.clear()
+        if rows:
+            with self.write_lock:
+                self.conn.executemany("INSERT OR REPLACE INTO price_history VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self.conn.commit()
+        return len(rows)
+
+    def query(self, source, token, start, end):
+        """
+        Returns the (timestamps, prices) arrays of (source, token) within [start, end],
+        combining hourly samples for the older part and raw samples for the recent part.
+        """
+        token = token.upper()
+        rows = self._reader().execute("""
+            SELECT start, count, data FROM price_history
+            WHERE source = ? AND token = ? AND start <= ? AND start + (CASE resolution WHEN ? THEN ? ELSE ? END) > ?
+            ORDER BY start
+        """, (source, token, end, RAW, BLOCK_SPANS[RAW], BLOCK_SPANS[HOURLY], start)).fetchall()
+        if not rows:
+            return np.empty(0), np.empty(0)
+
+        blocks = [decode_block(*row) for row in rows]
+        times = np.concatenate([block[0] for block in blocks])
+        prices = np.concatenate([block[1] for block in blocks])
+        order = np.argsort(times, kind="stable")
+        times, prices = times[order], prices[order]
+        mask = (times >= start) & (times <= end)
+        return times[mask], prices[mask]
+
+    def compact(self, now=None):
+        """
+        Downsamples raw blocks older than RAW_RETENTION into hourly averages and drops hourly
+        blocks older than HOURLY_RETENTION. Only the symbols written by this store are
+        compacted, so alert workers never touch each other's shards.
+        """
+        now = time.time() if now is None else now
+        self.last_compact = now
+        with self.lock:
+            symbols = list(self.open_blocks)
+
+        with self.write_lock:
+            for source, token in symbols:
+                self._compact_symbol(source, token, now)
+            self.conn.commit()
+
+    def _compact_symbol(self, source, token, now):
+        """Downsamples and expires the blocks of one symbol (writer connection, caller commits)."""
+        expired = self.conn.execute("""
+            SELECT start, count, data FROM price_history
+            WHERE source = ? AND token = ? AND resolution = ? AND start + ? <= ?
+        """, (source, token, RAW, BLOCK_SPANS[RAW], now - RAW_RETENTION)).fetchall()
+
+        if expired:
+            times = np.concatenate([decode_block(*row)[0] for row in expired])
+            prices = np.concatenate([decode_block(*row)[1] for row in expired])
+            hours = (times // HOURLY * HOURLY).astype(np.int64)
+            buckets, index = np.unique(hours, return_inverse=True)
+            means = np.bincount(index, weights=prices) / np.bincount(index)
+
+            span = BLOCK_SPANS[HOURLY]
+            for block_start in np.unique(buckets // span * span):
+                block_start = int(block_start)
+                in_block = (buckets >= block_start) & (buckets < block_start + span)
+                offsets, values = self._load_block(source, token, HOURLY, block_start, self.conn)
+                merged = dict(zip(offsets.tolist(), values.tolist()))
+                merged.update(zip((buckets[in_block] - block_start).tolist(), means[in_block].tolist()))
+                offsets = sorted(merged)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO price_history VALUES (?, ?, ?, ?, ?, ?)",
+                    (source, token, HOURLY, block_start, len(offsets),
+                     encode_block(offsets, [merged[offset] for offset in offsets])),
+                )
+            self.conn.executemany(
+                "DELETE FROM price_history WHERE source = ? AND token = ? AND resolution = ? AND start = ?",
+                [(source, token, RAW, row[0]) for row in expired],
+            )
+
+        self.conn.execute("""
+            DELETE FROM price_history
+            WHERE source = ? AND token = ? AND resolution = ? AND start + ? <= ?
+        """, (source, token, HOURLY, BLOCK_SPANS[HOURLY], now - HOURLY_RETENTION))
+
+    def record(self, samples, now=None):
+        """
+        Appends one poll ({source: {SYMBOL: price}}), flushes it and compacts once per
+        COMPACT_INTERVAL. Blocking, meant for a worker thread.
+        """
+        now = time.time() if now is None else now
+        for source, prices in samples.items():
+            self.append_prices(source, prices, now)
+        self.flush()
+        if now - self.last_compact >= COMPACT_INTERVAL:
+            self.compact(now)
+
+    def nbytes(self):
+        """Bytes of stored block data."""
+        return self._reader().execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM price_history").fetchone()[0]
@@ -1,13 +1,112 @@
 import requests
 import logging
 import os
+import gzip
+import json
+import asyncio
+import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from coingecko_index import update_index
 
 load_dotenv()
 
+# Define API endpoints for each source
+SOURCES = {
+    "Binance": "https://api.binance.com/api/v3/ticker/price",
+    "CoinGecko": "https://api.coingecko.com/api/v3/coins/list",
+    "CoinMarketCap": "https://pro-api.coinmarketcap.com/v1/cryptocurrency/map",
+    "ByBit": "https://api.bybit.com/v5/market/tickers?category=spot",
+    "OKX": "https://www.okx.com/api/v5/market/tickers?instType=SPOT"
+}
+
+# Refresh interval per source (seconds); aggregator coin lists change far less often than exchange listings
+REFRESH_INTERVALS = {
+    "Binance": 600,
+    "CoinGecko": 3600,
+    "CoinMarketCap": 3600,
+    "ByBit": 600,
+    "OKX": 600,
+}
+
+# Last good pair sets, loaded at startup before the live refresh finishes
+SNAPSHOT_PATH = os.getenv("TRADING_PAIRS_SNAPSHOT", "trading_pairs.json.gz")
+
+# Sources are refreshed in parallel worker threads; only one of them may write the snapshot at a time
+_snapshot_lock = threading.Lock()
+
+
+def fetch_trading_pairs(source):
+    """
+    Fetches the available trading pairs of a single source.
+
+    Returns:
+        set | None: The pair symbols, or None if the source could not be fetched.
+    """
+    url = SOURCES[source]
+
+    # API headers (needed only for CoinMarketCap)
+    headers = {"X-CMC_PRO_API_KEY": os.getenv("CMC_API_KEY")} if source == "CoinMarketCap" else {}
+
+    try:
+        logging.info(f"🔄 Fetching trading pairs from {source}...")
+
+        # Send request to the API
+        response = requests.get(url, headers=headers, timeout=15)
+
+        # Check if the request was successful
+        if response.status_code != 200:
+            logging.warning(f"⚠ {source}: Failed to fetch data (Status Code: {response.status_code})")
+            return None
+
+        data = response.json()  # Parse JSON response
+        logging.debug(f"📥 Response from {source}: {data}")
+
+        # Process response data based on the source
+        pairs = None
+        if source == "Binance":
+            pairs = {
+                item["symbol"].replace("USDT", "") for item in data if item["symbol"].endswith("USDT")
+            }
+
+        elif source == "CoinGecko":
+            if isinstance(data, list):
+                pairs = {item["symbol"].upper() for item in data}
+                update_index(data)  # Reuse the same payload for the symbol -> id index
+            else:
+                logging.warning("⚠ CoinGecko returned an unexpected response format!")
+
+        elif source == "CoinMarketCap":
+            pairs = {item["symbol"] for item in data.get("data", [])}
+
+        elif source == "ByBit":
+            pairs = {
+                item["symbol"].replace("USDT", "") for item in data.get("result", {}).get("list", []) if item["symbol"].endswith("USDT")
+            }
+
+        elif source == "OKX":
+            pairs = {
+                item["instId"].replace("-USDT", "") for item in data.get("data", []) if item["instId"].endswith("-USDT")
+            }
+
+        if pairs:
+            logging.info(f"✅ Retrieved {len(pairs)} pairs from {source}")
+            return pairs
+
+    except requests.exceptions.RequestException as e:
+        logging.error(f"❌ Request error while fetching from {source}: {e}")
+    except (KeyError, ValueError, TypeError) as e:
+        logging.error(f"❌ Error processing data from {source}: {e}")
+
+    return None
+
+
 def get_all_trading_pairs():
     """
     Fetches available trading pairs from multiple cryptocurrency data sources.
+    The sources are requested concurrently, so the total time is that of the slowest one.
 
     Supported sources:
     - Binance
@@ -18,72 +117,138 @@ def get_all_trading_pairs():
 
     Returns:
         dict: A dictionary where keys are exchange names and values are sets of trading pairs.
+              Sources that failed are left out.
     """
+    with ThreadPoolExecutor(max_workers=len(SOURCES)) as executor:
+        results = dict(zip(SOURCES, executor.map(fetch_trading_pairs, SOURCES)))
 
-    # Define API endpoints for each source
-    sources = {
-        "Binance": "https://api.binance.com/api/v3/ticker/price",
-        "CoinGecko": "https://api.coingecko.com/api/v3/coins/list",
-        "CoinMarketCap": "https://pro-api.coinmarketcap.com/v1/cryptocurrency/map",
-        "ByBit": "https://api.bybit.com/v5/market/tickers?category=spot",
-        "OKX": "https://www.okx.com/api/v5/market/tickers?instType=SPOT"
-    }
-
-    # API headers (needed only for CoinMarketCap)
-    headers = {
-        "CoinMarketCap": {"X-CMC_PRO_API_KEY": os.getenv("CMC_API_KEY")}
-    }
-
-    trading_pairs = {}  # Dictionary to store trading pairs for each source
-
-    for source, url in sources.items():
-        try:
-            logging.info(f"🔄 Fetching trading pairs from {source}...")
-            
-            # Send request to the API
-            response = requests.get(url, headers=headers.get(source, {}), timeout=15)
-
-            # Check if the request was successful
-            if response.status_code != 200:
-                logging.warning(f"⚠ {source}: Failed to fetch data (Status Code: {response.status_code})")
-                continue
-
-            data = response.json()  # Parse JSON response
-            logging.debug(f"📥 Response from {source}: {data}")
-
-            # Process response data based on the source
-            if source == "Binance":
-                trading_pairs[source] = {
-                    item["symbol"].replace("USDT", "") for item in data if item["symbol"].endswith("USDT")
-                }
-
-            elif source == "CoinGecko":
-                if isinstance(data, list):
-                    trading_pairs[source] = {item["symbol"].upper() for item in data}
-                else:
-                    logging.warning("⚠ CoinGecko returned an unexpected response format!")
-
-            elif source == "CoinMarketCap":
-                trading_pairs[source] = {item["symbol"] for item in data.get("data", [])}
-
-            elif source == "ByBit":
-                trading_pairs[source] = {
-                    item["symbol"].replace("USDT", "") for item in data.get("result", {}).get("list", []) if item["symbol"].endswith("USDT")
-                }
-
-            elif source == "OKX":
-                trading_pairs[source] = {
-                    item["instId"].replace("-USDT", "") for item in data.get("data", []) if item["instId"].endswith("-USDT")
-                }
-
-            logging.info(f"✅ Retrieved {len(trading_pairs.get(source, []))} pairs from {source}")
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"❌ Request error while fetching from {source}: {e}")
-        except (KeyError, ValueError, TypeError) as e:
-            logging.error(f"❌ Error processing data from {source}: {e}")
+    trading_pairs = {source: pairs for source, pairs in results.items() if pairs}
 
     total_pairs = sum(len(v) for v in trading_pairs.values())
     logging.info(f"✅ Successfully loaded {total_pairs} trading pairs")
 
-    return trading_pairs
\ No newline at end of file
+    return trading_pairs
+
+
+class TradingPairsScheduler:
+    """
+    Background refresh of the trading pair lists.
+
+    Every source runs on its own jittered interval. Failed fetches are retried with
+    exponential backoff (capped at the source's interval). The blocking HTTP work runs
+    in a worker thread, so handlers are never stalled. Successful results are swapped
+    into 'trading_pairs' in place and persisted to the snapshot.
+    """
+
+    def __init__(self, trading_pairs, intervals=None, jitter=0.1, retry_delay=30):
+        self.trading_pairs = trading_pairs
+        self.intervals = intervals or REFRESH_INTERVALS
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.tasks = []
+
+        # Per-source health: last success (wall clock), last fetch duration, consecutive failures
+        self.stats = {
+            source: {"last_success": None, "duration": None, "failures": 0}
+            for source in self.intervals
+        }
+
+    def start(self):
+        """Starts one refresh task per source; the first fetch happens immediately."""
+        self.tasks = [asyncio.create_task(self._run(source)) for source in self.intervals]
+
+    def stop(self):
+        """Cancels all refresh tasks."""
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def refresh(self, source):
+        """
+        Fetches one source off the event loop and swaps it in on success.
+        Returns True if the source was updated.
+        """
+        stats = self.stats[source]
+        started = time.monotonic()
+        pairs = await asyncio.to_thread(fetch_trading_pairs, source)
+        stats["duration"] = time.monotonic() - started
+
+        if not pairs:
+            stats["failures"] += 1
+            logging.warning(f"⚠ {source}: refresh failed ({stats['failures']} in a row), keeping the previous list")
+            return False
+
+        self.trading_pairs[source] = pairs
+        stats["last_success"] = time.time()
+        stats["failures"] = 0
+        logging.info(f"✅ {source}: {len(pairs)} pairs refreshed in {stats['duration']:.2f}s")
+
+        await asyncio.to_thread(save_snapshot, dict(self.trading_pairs))
+        return True
+
+    def next_delay(self, source):
+        """Returns the jittered delay before the next fetch of 'source'."""
+        interval = self.intervals[source]
+        failures = self.stats[source]["failures"]
+        delay = interval if failures == 0 else min(self.retry_delay * 2 ** (failures - 1), interval)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _run(self, source):
+        """Refresh loop of a single source."""
+        while True:
+            try:
+                await self.refresh(source)
+            except Exception as e:
+                self.stats[source]["failures"] += 1
+                logging.error(f"❌ {source}: unexpected error while refreshing trading pairs: {e}")
+            await asyncio.sleep(self.next_delay(source))
+
+    def report(self):
+        """
+        Returns per-source refresh health.
+
+        Returns:
+            dict: source -> {"age": seconds since last success or None, "duration": last fetch
+                  duration in seconds, "failures": consecutive failures}
+        """
+        now = time.time()
+        return {
+            source: {
+                "age": None if stats["last_success"] is None else round(now - stats["last_success"], 1),
+                "duration": None if stats["duration"] is None else round(stats["duration"], 2),
+                "failures": stats["failures"],
+            }
+            for source, stats in self.stats.items()
+        }
+
+
+def save_snapshot(trading_pairs, path=SNAPSHOT_PATH):
+    """Persists the pair sets as gzip-compressed JSON (sorted lists per source)."""
+    data = {source: sorted(pairs) for source, pairs in trading_pairs.items()}
+    tmp_path = f"{path}.tmp"
+    try:
+        with _snapshot_lock:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)  # Atomic swap, a crash never leaves a half-written snapshot
+    except OSError as e:
+        logging.error(f"❌ Could not save trading pairs snapshot {path}: {e}")
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Loads the last saved pair sets.
+
+    Returns:
+        dict: Source -> set of pairs (empty if there is no usable snapshot).
+    """
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        return {source: set(pairs) for source, pairs in data.items()}
+    except (OSError, ValueError) as e:
+        logging.error(f"❌ Could not read trading pairs snapshot {path}: {e}")
+        return {}
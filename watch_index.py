@@ -0,0 +1,388 @@
+import bisect
+import math
+import sys
+import time
+from array import array
+import numpy as np
+from alert_engine import ALERT_THRESHOLD, ALERT_DIRECTION
+
+
+# Baseline moves of one symbol above which its bands are rebuilt in one sort
+# instead of moving every watcher separately
+BULK_REBUILD = 1000
+
+
+def trigger_prices(baseline, threshold, direction):
+    """Returns the (rise, drop) trigger prices of a baseline; None for a direction that is not watched."""
+    if baseline <= 0:
+        return None, None  # Never compared, like in the batch evaluation
+    ratio = threshold / 100
+    up = baseline * (1 + ratio) if direction in ("both", "up") else None
+    down = baseline * (1 - ratio) if direction in ("both", "down") and ratio < 1 else None
+    return up, down
+
+
+class TriggerBand:
+    """
+    Watchers sorted by the price at which they trigger, stored as parallel compact arrays
+    (trigger price, user id, baseline).
+    """
+
+    __slots__ = ("triggers", "users", "baselines")
+
+    def __init__(self):
+        self.triggers = array("d")
+        self.users = array("q")
+        self.baselines = array("d")
+
+    @classmethod
+    def from_numpy(cls, triggers, users, baselines):
+        """Builds a band from numpy arrays that are already sorted by trigger."""
+        band = cls()
+        band.triggers.frombytes(triggers.astype(np.float64).tobytes())
+        band.users.frombytes(users.astype(np.int64).tobytes())
+        band.baselines.frombytes(baselines.astype(np.float64).tobytes())
+        return band
+
+    def __len__(self):
+        return len(self.users)
+
+    def insert(self, trigger, user_id, baseline):
+        position = bisect.bisect_right(self.triggers, trigger)
+        self.triggers.insert(position, trigger)
+        self.users.insert(position, user_id)
+        self.baselines.insert(position, baseline)
+
+    def remove(self, trigger, user_id):
+        """Removes the watcher of 'user_id' stored at 'trigger' (found by binary search)."""
+        position = bisect.bisect_left(self.triggers, trigger)
+        end = bisect.bisect_right(self.triggers, trigger, position)
+        for position in range(position, end):
+            if self.users[position] == user_id:
+                del self.triggers[position]
+                del self.users[position]
+                del self.baselines[position]
+                return
+
+    def below(self, price):
+        """Watchers whose trigger is strictly below 'price' (a prefix of the band)."""
+        end = bisect.bisect_left(self.triggers, price)
+        return [(self.users[i], self.baselines[i]) for i in range(end)]
+
+    def above(self, price):
+        """Watchers whose trigger is strictly above 'price' (a suffix of the band)."""
+        start = bisect.bisect_right(self.triggers, price)
+        return [(self.users[i], self.baselines[i]) for i in range(start, len(self.triggers))]
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(a) for a in (self.triggers, self.users, self.baselines))
+
+
+class MemberTable:
+    """
+    The seeded watchers of a symbol sorted by user id, as parallel compact arrays
+    (user id, rise trigger, drop trigger, baseline); NaN marks an unwatched direction.
+    Lookups are binary searches, and moving the baseline of a member is done in place.
+    """
+
+    __slots__ = ("users", "rises", "drops", "baselines")
+
+    def __init__(self):
+        self.users = array("q")
+        self.rises = array("d")
+        self.drops = array("d")
+        self.baselines = array("d")
+
+    @classmethod
+    def from_lists(cls, users, rises, drops, baselines):
+        """Builds a table from unsorted lists of unique users (None triggers become NaN)."""
+        users = np.array(users, dtype=np.int64)
+        order = np.argsort(users, kind="stable")
+        table = cls()
+        table.users.frombytes(users[order].tobytes())
+        for target, values in ((table.rises, rises), (table.drops, drops), (table.baselines, baselines)):
+            target.frombytes(np.array(values, dtype=np.float64)[order].tobytes())
+        return table
+
+    def __len__(self):
+        return len(self.users)
+
+    def _position(self, user_id):
+        position = bisect.bisect_left(self.users, user_id)
+        if position < len(self.users) and self.users[position] == user_id:
+            return position
+        return None
+
+    def __contains__(self, user_id):
+        return self._position(user_id) is not None
+
+    def get(self, user_id):
+        """Returns (rise trigger, drop trigger, baseline) of a member, or None."""
+        position = self._position(user_id)
+        if position is None:
+            return None
+        return self.rises[position], self.drops[position], self.baselines[position]
+
+    def set(self, user_id, rise, drop, baseline):
+        """Stores a member; None triggers are stored as NaN."""
+        rise = math.nan if rise is None else rise
+        drop = math.nan if drop is None else drop
+        position = bisect.bisect_left(self.users, user_id)
+        if position < len(self.users) and self.users[position] == user_id:
+            self.rises[position], self.drops[position], self.baselines[position] = rise, drop, baseline
+            return
+        self.users.insert(position, user_id)
+        self.rises.insert(position, rise)
+        self.drops.insert(position, drop)
+        self.baselines.insert(position, baseline)
+
+    def pop(self, user_id):
+        """Removes a member; returns its (rise trigger, drop trigger, baseline) or None."""
+        position = self._position(user_id)
+        if position is None:
+            return None
+        entry = self.rises[position], self.drops[position], self.baselines[position]
+        for values in (self.users, self.rises, self.drops, self.baselines):
+            del values[position]
+        return entry
+
+    def nbytes(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(a) for a in (self.users, self.rises, self.drops, self.baselines))
+
+
+class Watchers:
+    """
+    Watchers of one (source, symbol).
+
+    Every watcher with a baseline b, threshold t and direction is turned into trigger
+    prices: b * (1 + t) for rises and b * (1 - t) for drops. The rise triggers are kept
+    sorted in one band and the drop triggers in another, so a price tick finds everyone
+    it triggers with two binary searches, however different the thresholds are.
+    """
+
+    __slots__ = ("ups", "downs", "unseeded", "members")
+
+    def __init__(self):
+        self.ups = TriggerBand()  # Rise triggers, ascending
+        self.downs = TriggerBand()  # Drop triggers, ascending
+        self.unseeded = set()  # Watchers without a baseline yet
+        self.members = MemberTable()  # Seeded watchers with their trigger prices, by user id
+
+    def __len__(self):
+        return len(self.members) + len(self.unseeded)
+
+    def __contains__(self, user_id):
+        return user_id in self.unseeded or user_id in self.members
+
+    def add(self, user_id, baseline, threshold=ALERT_THRESHOLD, direction=ALERT_DIRECTION):
+        """Adds a watcher (replacing an existing entry of the same user)."""
+        self.remove(user_id)
+        if baseline is None:
+            self.unseeded.add(user_id)
+            return
+
+        up, down = trigger_prices(baseline, threshold, direction)
+        self.members.set(user_id, up, down, baseline)
+        if up is not None:
+            self.ups.insert(up, user_id, baseline)
+        if down is not None:
+            self.downs.insert(down, user_id, baseline)
+
+    def remove(self, user_id):
+        """Removes a watcher if present."""
+        self.unseeded.discard(user_id)
+        entry = self.members.pop(user_id)
+        if entry is None:
+            return
+        up, down, _ = entry
+        if not math.isnan(up):
+            self.ups.remove(up, user_id)
+        if not math.isnan(down):
+            self.downs.remove(down, user_id)
+
+    def rebuild(self):
+        """Rebuilds both bands from 'members' with one sort each (bulk loads and baseline moves)."""
+        members = self.members
+        users = np.frombuffer(members.users, dtype=np.int64) if len(members) else np.empty(0, np.int64)
+        baselines = np.frombuffer(members.baselines, dtype=np.float64) if len(members) else np.empty(0)
+        bands = []
+        for column in (members.rises, members.drops):
+            triggers = np.frombuffer(column, dtype=np.float64) if len(members) else np.empty(0)
+            watched = ~np.isnan(triggers)
+            order = np.argsort(triggers[watched], kind="stable")
+            bands.append(TriggerBand.from_numpy(triggers[watched][order], users[watched][order], baselines[watched][order]))
+        self.ups, self.downs = bands
+
+    def triggered(self, price):
+        """Returns the (user_id, baseline) pairs whose threshold is crossed by 'price'."""
+        return self.ups.below(price) + self.downs.above(price)
+
+    def nbytes(self):
+        """Memory used by this entry: arrays, the slots object and the unseeded set with its ints."""
+        return (
+            sys.getsizeof(self) + self.ups.nbytes() + self.downs.nbytes() + self.members.nbytes()
+            + (sys.getsizeof(self.unseeded) + sum(map(sys.getsizeof, self.unseeded)) if self.unseeded else 0)
+        )
+
+
+class WatcherIndex:
+    """
+    Inverted index (source, SYMBOL) -> Watchers of the favorites on each user's active source.
+
+    It is loaded from the database once and kept in sync by the handlers that add or
+    remove favorites, switch sources, change alert rules and move baselines, so a price
+    update only evaluates the watchers of that one symbol.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.rules = {}  # (source, SYMBOL, user_id) -> (threshold, direction, cooldown), custom rules only
+        self.last_alerts = {}  # (source, SYMBOL, user_id) -> time of the last alert, watches with a cooldown only
+
+    def load(self, rows):
+        """
+        Rebuilds the index from Database.get_alert_rows rows:
+        (user_id, source, token, last_price, threshold, direction, cooldown, last_alert_at).
+        The trigger prices are collected per symbol first and every band is sorted once.
+        """
+        entries, rules, last_alerts = {}, {}, {}
+        seeded = {}  # key -> ([user], [rise trigger], [drop trigger], [baseline]), turned into member tables below
+        for user_id, source, token, last_price, threshold, direction, cooldown, last_alert_at in rows:
+            key = (source, token.upper())
+            watchers = entries.get(key)
+            if watchers is None:
+                watchers = entries[key] = Watchers()
+
+            if threshold is not None:
+                rules[(*key, user_id)] = (threshold, direction, cooldown)
+                if cooldown and last_alert_at:
+                    last_alerts[(*key, user_id)] = last_alert_at
+            else:
+                threshold, direction = ALERT_THRESHOLD, ALERT_DIRECTION
+
+            # (user_id, source, token) is the favorites primary key, so every watch appears once
+            if last_price is None:
+                watchers.unseeded.add(user_id)
+                continue
+            columns = seeded.get(key)
+            if columns is None:
+                columns = seeded[key] = ([], [], [], [])
+            up, down = trigger_prices(last_price, threshold, direction)
+            columns[0].append(user_id)
+            columns[1].append(up)
+            columns[2].append(down)
+            columns[3].append(last_price)
+
+        for key, columns in seeded.items():
+            entries[key].members = MemberTable.from_lists(*columns)
+        for watchers in entries.values():
+            watchers.rebuild()
+
+        self.entries, self.rules, self.last_alerts = entries, rules, last_alerts
+
+    def add(self, source, token, user_id, baseline=None):
+        """Adds or replaces the watch of 'user_id' on (source, token)."""
+        key = (source, token.upper())
+        watchers = self.entries.get(key)
+        if watchers is None:
+            watchers = self.entries[key] = Watchers()
+        threshold, direction, _ = self.rules.get((*key, user_id), (ALERT_THRESHOLD, ALERT_DIRECTION, 0))
+        watchers.add(user_id, baseline, threshold, direction)
+
+    def set_baseline(self, source, token, user_id, baseline):
+        """Moves the baseline of an existing watch (ignored if the watch is not indexed)."""
+        watchers = self.entries.get((source, token.upper()))
+        if watchers is not None and user_id in watchers:
+            self.add(source, token, user_id, baseline)
+
+    def set_baselines(self, baselines):
+        """
+        Moves the baselines of (user_id, source, token, price) rows, ignoring watches that are
+        not indexed. A symbol with more than BULK_REBUILD moves is re-sorted once instead of
+        moving every watcher in its bands.
+        """
+        moves = {}
+        for user_id, source, token, price in baselines:
+            moves.setdefault((source, token.upper()), []).append((user_id, price))
+
+        for key, moved in moves.items():
+            watchers = self.entries.get(key)
+            if watchers is None:
+                continue
+            if len(moved) <= BULK_REBUILD:
+                for user_id, price in moved:
+                    if user_id in watchers:
+                        self.add(*key, user_id, price)
+                continue
+
+            for user_id, price in moved:
+                if user_id not in watchers:
+                    continue
+                threshold, direction, _ = self.rules.get((*key, user_id), (ALERT_THRESHOLD, ALERT_DIRECTION, 0))
+                watchers.unseeded.discard(user_id)
+                watchers.members.set(user_id, *trigger_prices(price, threshold, direction), price)
+            watchers.rebuild()
+
+    def set_rule(self, source, token, user_id, baseline, threshold=None, direction=None, cooldown=0):
+        """Applies a custom alert rule (threshold=None restores the defaults) and re-indexes the watch."""
+        key = (source, token.upper(), user_id)
+        if threshold is None:
+            self.rules.pop(key, None)
+            self.last_alerts.pop(key, None)
+        else:
+            self.rules[key] = (threshold, direction, cooldown)
+        self.add(source, token, user_id, baseline)
+
+    def in_cooldown(self, source, token, user_id, now=None):
+        """Returns True if the watch was alerted less than its cooldown ago."""
+        key = (source, token.upper(), user_id)
+        last_alert = self.last_alerts.get(key)
+        if last_alert is None:
+            return False
+        cooldown = self.rules.get(key, (None, None, 0))[2]
+        return (now or time.time()) - last_alert < cooldown
+
+    def record_alert(self, source, token, user_id, when):
+        """Remembers the time of an alert for watches that have a cooldown."""
+        key = (source, token.upper(), user_id)
+        if self.rules.get(key, (None, None, 0))[2]:
+            self.last_alerts[key] = when
+
+    def remove(self, source, token, user_id):
+        """Removes the watch of 'user_id' on (source, token) together with its alert rule."""
+        key = (source, token.upper())
+        self.rules.pop((*key, user_id), None)
+        self.last_alerts.pop((*key, user_id), None)
+        watchers = self.entries.get(key)
+        if watchers is None:
+            return
+        watchers.remove(user_id)
+        if not len(watchers):
+            del self.entries[key]
+
+    def get(self, source, token):
+        """Returns the Watchers of (source, token), or None."""
+        return self.entries.get((source, token.upper()))
+
+    def symbols(self, source):
+        """Returns the symbols watched on 'source'."""
+        return {token for src, token in self.entries if src == source}
+
+    def nbytes(self):
+        """
+        Memory used by the index: the entries with their keys, the per-symbol arrays and the
+        rule and cooldown tables with their keys and values (source names are shared).
+        """
+        total = sys.getsizeof(self.entries)
+        for key, watchers in self.entries.items():
+            total += sys.getsizeof(key) + sys.getsizeof(key[1]) + watchers.nbytes()
+        for table in (self.rules, self.last_alerts):
+            total += sys.getsizeof(table)
+            for key, value in table.items():
+                total += sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof(key[2]) + sys.getsizeof(value)
+                if isinstance(value, tuple):
+                    total += sum(map(sys.getsizeof, value))
+        return total
+
+    def __len__(self):
+        return sum(len(watchers) for watchers in self.entries.values())
@@ -0,0 +1,90 @@
+import logging
+import os
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from price_engine import breaker_report
+from metrics import render as render_metrics, set_log_level
+
+# "polling" pulls updates with getUpdates, "webhook" lets Telegram push them to WEBHOOK_URL
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+
+# Public base URL of the service (e.g. https://crypto-price-bot.onrender.com) and the path updates are posted to.
+# Render sets RENDER_EXTERNAL_URL for every web service, so WEBHOOK_URL is only needed elsewhere.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+
+# Sent back by Telegram in the X-Telegram-Bot-Api-Secret-Token header, other requests are rejected
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+# Hosting platforms pass the port to listen on in PORT
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8080))
+
+# Bearer token for the admin endpoints (log level); they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# Set once the bot has finished starting up and can handle updates
+READY = web.AppKey("ready", bool)
+
+
+async def health(request):
+    """Liveness: the event loop is serving requests."""
+    return web.Response(text="Bot is running!")
+
+
+async def ready(request):
+    """Readiness: startup has finished (snapshot, watcher index, webhook registration)."""
+    if request.app[READY]:
+        return web.Response(text="ready")
+    return web.Response(status=503, text="starting")
+
+
+async def sources(request):
+    """Circuit breaker state of every price source."""
+    return web.json_response(breaker_report())
+
+
+async def metrics(request):
+    """Hot path metrics in the Prometheus text format."""
+    return web.Response(body=render_metrics().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def loglevel(request):
+    """
+    Switches the log level without a restart, e.g. POST /admin/loglevel?level=DEBUG to see
+    every price lookup. Requires 'Authorization: Bearer <ADMIN_TOKEN>'.
+    """
+    if ADMIN_TOKEN is None or request.headers.get("Authorization") != f"Bearer {ADMIN_TOKEN}":
+        return web.Response(status=401, text="unauthorized")
+    level = set_log_level(request.query.get("level", ""))
+    if level is None:
+        return web.Response(status=400, text="unknown level")
+    return web.Response(text=level)
+
+
+def create_app(dp, bot, webhook=False):
+    """
+    Builds the aiohttp application: health and metrics endpoints, plus the Telegram webhook in webhook mode.
+    Updates are fed to the dispatcher in the background, so Telegram gets its 200 right away.
+    """
+    app = web.Application()
+    app[READY] = False
+    app.router.add_get("/", health)
+    app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/health/sources", sources)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_post("/admin/loglevel", loglevel)
+
+    if webhook:
+        SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    return app
+
+
+async def start_server(app, host=HOST, port=PORT):
+    """Serves 'app' on the running event loop; returns the runner used to stop it."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"✅ HTTP server listening on {host}:{port}")
+    return runner